@@ -0,0 +1,216 @@
+import numpy as np
+
+from mutable_merkle import util
+
+
+# A MerkleTree storing each level as a (width, hash_len) uint8 array, padded
+# with empty rows to a power of two. Sibling pairs are a zero copy
+# (width / 2, 2 * hash_len) view, so parents are hashed straight from the
+# level buffer without building ``left + right`` for every node, and
+# comparisons, diffs and marshal packing work on whole levels at once.
+#
+# Roots, proofs and marshal payloads match MerkleTree for the same leaves.
+class ArrayMerkleTree:
+    @classmethod
+    def new(cls, leaves, hash_type, hashed=False):
+        mt = cls(hash_type)
+
+        if not leaves:
+            return mt
+
+        if not hashed:
+            leaves = [util.hash(leaf, mt._hashfn) for leaf in leaves]
+
+        leaf_count = len(leaves)
+        mt._resize(mt._depth(leaf_count))
+        mt.branches[0][:leaf_count] = mt._rows(b"".join(leaves))
+        mt._leaf_count = leaf_count
+
+        mt._rebuild(0, leaf_count - 1, leaf_count - 1)
+
+        return mt
+
+    def __init__(self, hash_type, root=None, branches=None, leaf_count=0, branch_count=0):
+        self._hash_type = hash_type
+        self._hash_len = util.get_hash_len(hash_type)
+        self._hashfn = util.get_hashfn(hash_type)
+
+        self._empty = bytearray(self._hash_len)
+        self.root = root or self._empty
+        self._branch_count = branch_count
+        self._leaf_count = leaf_count
+        self.branches = branches or {}
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.root == other.root
+
+    def __len__(self):
+        return self._leaf_count
+
+    @staticmethod
+    def _depth(leaf_count):
+        return max(1, (leaf_count - 1).bit_length())
+
+    def _rows(self, data):
+        return np.frombuffer(data, dtype=np.uint8).reshape(-1, self._hash_len)
+
+    def _count(self, branch_index):
+        # Populated nodes on a level, a lone leaf keeps its empty sibling.
+        count = -(-self._leaf_count >> branch_index)
+        return max(count, 2) if self._leaf_count else 0
+
+    def _resize(self, branch_count):
+        for branch_index in range(branch_count):
+            width = 1 << (branch_count - branch_index)
+            level = np.zeros((width, self._hash_len), dtype=np.uint8)
+            if branch_index in self.branches:
+                old = self.branches[branch_index][:width]
+                level[:len(old)] = old
+            elif branch_index == self._branch_count and self._leaf_count:
+                level[0] = self._rows(self.root)
+            self.branches[branch_index] = level
+
+        for branch_index in range(branch_count, self._branch_count):
+            del self.branches[branch_index]
+
+        self._branch_count = branch_count
+
+    def pairs(self, branch_index):
+        return self.branches[branch_index].reshape(-1, 2 * self._hash_len)
+
+    def _hash_pairs(self, branch_index, start, stop):
+        # start/stop index pairs; rows are hashed in place from the level buffer.
+        hashfn = self._hashfn
+        step = 2 * self._hash_len
+        view = memoryview(self.branches[branch_index][2 * start:2 * stop]).cast("B")
+        return b"".join([hashfn(view[i:i + step]).digest() for i in range(0, len(view), step)])
+
+    def _rebuild(self, start_index, end_index, old_end_index):
+        # Rehash every parent covering [start_index, end_index] and zero the
+        # parents of nodes in (end_index, old_end_index] that no longer exist.
+        for branch_index in range(self._branch_count):
+            start = start_index >> 1
+            stop = (end_index >> 1) + 1
+            digests = self._hash_pairs(branch_index, start, stop)
+
+            if branch_index + 1 == self._branch_count:
+                self.root = bytearray(digests[-self._hash_len:])
+                return
+
+            parent = self.branches[branch_index + 1]
+            parent[start:stop] = self._rows(digests)
+            parent[stop:(old_end_index >> 1) + 1] = 0
+
+            start_index, end_index, old_end_index = start, stop - 1, old_end_index >> 1
+
+    def _update_path(self, index):
+        hashfn = self._hashfn
+        for branch_index in range(self._branch_count):
+            index >>= 1
+            digest = hashfn(self.pairs(branch_index)[index]).digest()
+            if branch_index + 1 == self._branch_count:
+                self.root = bytearray(digest)
+            else:
+                self.branches[branch_index + 1][index] = self._rows(digest)[0]
+
+    def add_leaf(self, value, hashed=False):
+        if not hashed:
+            value = util.hash(value, self._hashfn)
+
+        index = self._leaf_count
+        if self._branch_count == 0 or index + 1 > 1 << self._branch_count:
+            self._resize(self._depth(index + 1))
+
+        self.branches[0][index] = self._rows(value)[0]
+        self._leaf_count += 1
+        self._update_path(index)
+
+    def update_leaf(self, value, offset, hashed=False):
+        if self._leaf_count == 0 or offset >= self._leaf_count:
+            raise IndexError("assignment index out of range")
+
+        if not hashed:
+            value = util.hash(value, self._hashfn)
+
+        self.branches[0][offset] = self._rows(value)[0]
+        self._update_path(offset)
+
+    def remove_leaf(self, offset):
+        if self._leaf_count == 0:
+            raise IndexError("pop from empty list")
+
+        if offset >= self._leaf_count:
+            raise IndexError("pop index out of range")
+
+        leaves = self.branches[0]
+        last = self._leaf_count - 1
+        leaves[offset:last] = leaves[offset + 1:last + 1]
+        leaves[last] = 0
+        self._leaf_count = last
+
+        if last == 0:
+            self._resize(0)
+            self.root = self._empty
+            return
+
+        depth = self._depth(last)
+        if depth < self._branch_count:
+            self._resize(depth)
+
+        self._rebuild(min(offset, last - 1), last - 1, last)
+
+    def get_proof(self, index):
+        chain = [self._hash_type.encode().hex()]
+        for branch_index in range(self._branch_count):
+            sibling_index = index ^ 1
+            sibling = self.branches[branch_index][sibling_index]
+            chain.append(["R" if sibling_index & 1 else "L", sibling.tobytes()])
+            index >>= 1
+        chain.append(["ROOT", bytes(self.root)])
+
+        return chain
+
+    def empty_nodes(self, branch_index):
+        return ~self.branches[branch_index].any(axis=1)
+
+    def diff(self, other):
+        # Offsets of leaves that differ, compared a whole level at a time.
+        if self._hash_type != other._hash_type:
+            raise ValueError("cannot diff trees with different hash types")
+
+        width = max(len(self), len(other))
+        mine = np.zeros((width, self._hash_len), dtype=np.uint8)
+        theirs = np.zeros((width, self._hash_len), dtype=np.uint8)
+        if len(self):
+            mine[:len(self)] = self.branches[0][:len(self)]
+        if len(other):
+            theirs[:len(other)] = other.branches[0][:len(other)]
+
+        return np.flatnonzero((mine != theirs).any(axis=1))
+
+    def marshal(self):
+        return {
+            "hash_type": self._hash_type,
+            "root": self.root.hex(),
+            "branches": {k: level[:self._count(k)].tobytes().hex() for k, level in self.branches.items()},
+            "leaf_count": self._leaf_count,
+            "branch_count": self._branch_count,
+            "arity": 2,
+        }
+
+    @classmethod
+    def unmarshal(cls, payload):
+        if payload.get("arity", 2) != 2:
+            raise ValueError("ArrayMerkleTree only supports binary trees")
+
+        mt = cls(
+            hash_type=payload["hash_type"],
+            root=bytearray.fromhex(payload["root"]),
+            leaf_count=payload["leaf_count"],
+        )
+        mt._resize(payload["branch_count"])
+        for k, nodes in payload["branches"].items():
+            rows = mt._rows(bytes.fromhex(nodes))
+            mt.branches[int(k)][:len(rows)] = rows
+
+        return mt
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from mutable_merkle import util
+from mutable_merkle.tree import MerkleTree
+
+
+# Leaves are partitioned across ``shard_count`` independent trees, and a top
+# tree holds one leaf per shard root. A rebuild only touches 1/N of the data,
+# and shards are locked individually so writers to different shards do not
+# wait on each other. That is not CPU parallelism: internal nodes hash 64 byte
+# inputs, for which hashlib keeps the GIL.
+class MerkleForest:
+    @classmethod
+    def new(cls, shard_leaves, hash_type, hashed=False):
+        forest = cls(hash_type, len(shard_leaves))
+        for shard, leaves in enumerate(shard_leaves):
+            forest.shards[shard] = MerkleTree.new(leaves, hash_type, hashed=hashed)
+            forest._publish(shard)
+
+        return forest
+
+    def __init__(self, hash_type, shard_count, shards=None):
+        if shard_count < 1:
+            raise ValueError("a forest needs at least one shard")
+
+        if shards is not None and len(shards) != shard_count:
+            raise ValueError("shard_count does not match the number of shards")
+
+        self._hash_type = hash_type
+        self._hashfn = util.get_hashfn(hash_type)
+        self.shards = shards or [MerkleTree(hash_type) for _ in range(shard_count)]
+        self._locks = [threading.Lock() for _ in range(shard_count)]
+        self._top_lock = threading.Lock()
+        self._top = MerkleTree.new(
+            [bytes(shard.root) for shard in self.shards],
+            hash_type,
+            hashed=True,
+        )
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.root == other.root
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    @property
+    def root(self):
+        return self._top.root
+
+    def shard_for(self, value, hashed=False):
+        if not hashed:
+            value = util.hash(value, self._hashfn)
+
+        return int.from_bytes(bytes(value[:8]), "big") % len(self.shards)
+
+    def _publish(self, shard):
+        root = bytes(self.shards[shard].root)
+        with self._top_lock:
+            self._top.update_leaf(root, shard, hashed=True)
+
+    def _mutate(self, shard, operations):
+        tree = self.shards[shard]
+        with self._locks[shard]:
+            try:
+                for name, args, kwargs in operations:
+                    getattr(tree, name)(*args, **kwargs)
+            finally:
+                # Operations applied before a failing one stay applied, so the
+                # top tree has to follow the shard either way.
+                self._publish(shard)
+
+    def add_leaf(self, shard, value, hashed=False):
+        self._mutate(shard, [("add_leaf", (value,), {"hashed": hashed})])
+
+    def update_leaf(self, shard, value, offset, hashed=False):
+        self._mutate(shard, [("update_leaf", (value, offset), {"hashed": hashed})])
+
+    def remove_leaf(self, shard, offset):
+        self._mutate(shard, [("remove_leaf", (offset,), {})])
+
+    def apply(self, operations, max_workers=None):
+        # operations: iterable of (method_name, shard, *args). Operations on a
+        # shard keep their order and the top tree is updated once per touched
+        # shard. Shards get a thread each, which only overlaps hashing of
+        # leaf values large enough for hashlib to release the GIL.
+        by_shard = OrderedDict()
+        for name, shard, *args in operations:
+            if name not in ("add_leaf", "update_leaf", "remove_leaf"):
+                raise ValueError("unsupported forest operation: {}".format(name))
+            by_shard.setdefault(shard, []).append((name, args, {}))
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(by_shard) or 1) as executor:
+            futures = [executor.submit(self._mutate, shard, ops) for shard, ops in by_shard.items()]
+            for future in futures:
+                future.result()
+
+    def get_proof(self, shard, offset):
+        with self._locks[shard]:
+            shard_proof = self.shards[shard].get_proof(offset)
+            with self._top_lock:
+                top_proof = self._top.get_proof(shard)
+
+        return util.combine_proofs(shard_proof, top_proof)
+
+    def marshal(self):
+        return {
+            "hash_type": self._hash_type,
+            "shards": [shard.marshal() for shard in self.shards],
+        }
+
+    @classmethod
+    def unmarshal(cls, payload):
+        shards = [MerkleTree.unmarshal(shard) for shard in payload["shards"]]
+        return cls(payload["hash_type"], len(shards), shards=shards)
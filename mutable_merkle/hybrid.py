@@ -0,0 +1,145 @@
+from mutable_merkle.tree import MerkleTree
+
+
+# A MerkleTree that stores the leaves and the levels from subtree_height up,
+# dropping the internal levels in between. A dropped node is rehashed from the
+# arity ** subtree_height leaves beneath it whenever an update or a proof needs
+# it, trading a bounded amount of hashing per operation for memory: a binary
+# tree with the default height keeps about n * 1.125 nodes instead of 2n.
+class HybridMerkleTree(MerkleTree):
+    def __init__(self, *args, subtree_height=4, **kwargs):
+        if subtree_height < 1:
+            raise ValueError("subtree_height must be at least 1")
+
+        self._height = subtree_height
+        super().__init__(*args, **kwargs)
+
+        for branch_index in range(1, subtree_height):
+            self.branches.pop(branch_index, None)
+
+    @classmethod
+    def new(cls, leaves, hash_type, hashed=False, indexed=False, arity=2, subtree_height=4):
+        mt = cls(hash_type, indexed=indexed, arity=arity, subtree_height=subtree_height)
+        return mt._build(leaves, hashed)
+
+    def _dropped(self, branch_index):
+        return 0 < branch_index < self._height
+
+    def _node(self, branch_index, index):
+        # Rehash a dropped node from the leaves beneath it.
+        width = 1 << self._shift * branch_index
+        first = index * width
+        if first >= self._leaf_count:
+            return self._empty
+
+        hashfn = self._hashfn
+        arity = self._arity
+        nodes = self.branches[0][first:min(first + width, self._leaf_count)]
+        for _ in range(branch_index):
+            nodes.extend([self._empty] * (-len(nodes) % arity))
+            nodes = [bytearray(hashfn(b"".join(nodes[i:i + arity])).digest()) for i in range(0, len(nodes), arity)]
+
+        return nodes[0]
+
+    def _add_branch(self):
+        if self._dropped(self._branch_count):
+            self._branch_count += 1
+        else:
+            super()._add_branch()
+
+    def _get(self, offset, branch_index):
+        if self._dropped(branch_index):
+            return self._node(branch_index, offset)
+
+        return super()._get(offset, branch_index)
+
+    def _update_parent(self, value, index, branch_index):
+        if branch_index >= self._height:
+            return super()._update_parent(value, index, branch_index)
+
+        if self._branch_count <= self._height:
+            self.root = self._node(self._branch_count, 0)
+            return
+
+        index >>= self._shift * self._height
+        value = self._node(self._height, index)
+        self._update_branch(value, index, self._height)
+        super()._update_parent(value, index, self._height)
+
+    def _rebuild_branch(self, branch_index, start_index, end_index):
+        if branch_index >= self._height:
+            return super()._rebuild_branch(branch_index, start_index, end_index)
+
+        # From the last leaf, zero out any values that used to be populated
+        leaves = self.branches[0]
+        if end_index + 1 < self._capacity():
+            del leaves[end_index + 1:]
+            # A lone leaf keeps its empty sibling.
+            if end_index == 0:
+                leaves.append(self._empty)
+
+        if self._branch_count <= self._height:
+            self.root = self._node(self._branch_count, 0)
+            return
+
+        shift = self._shift * self._height
+        start_index >>= shift
+        end_index >>= shift
+        nodes = [self._node(self._height, index) for index in range(start_index, end_index + 1)]
+        self.branches[self._height][start_index:end_index + 1] = nodes
+        super()._rebuild_branch(self._height, start_index, end_index)
+
+    def extract_subtree(self, offset, size):
+        # As MerkleTree.extract_subtree, keeping this tree's subtree_height.
+        # Only the block's root can be on a dropped level and need rehashing.
+        leaf_count, depth = self._check_extract(offset, size)
+
+        branches = {}
+        for branch_index in range(depth):
+            if self._dropped(branch_index):
+                continue
+
+            start = offset >> self._shift * branch_index
+            count = -(-leaf_count >> self._shift * branch_index)
+            branches[branch_index] = self.branches[branch_index][start:start + count]
+            # A lone node keeps its empty sibling.
+            if count == 1:
+                branches[branch_index].append(self._empty)
+
+        if depth == self._branch_count:
+            root = self.root
+        else:
+            root = self._get(offset >> self._shift * depth, depth)
+
+        return type(self)(
+            self._hash_type,
+            root=root,
+            branches=branches,
+            leaf_count=leaf_count,
+            branch_count=depth,
+            arity=self._arity,
+            subtree_height=self._height,
+        )
+
+    def _config(self):
+        config = super()._config()
+        config["subtree_height"] = self._height
+        return config
+
+    def marshal(self):
+        payload = super().marshal()
+        payload["subtree_height"] = self._height
+        return payload
+
+    @classmethod
+    def unmarshal(cls, payload, indexed=False):
+        return cls(
+            hash_type=payload["hash_type"],
+            root=bytes.fromhex(payload["root"]),
+            branches={k: cls._unpack_leaves(leaves, payload["hash_type"]) for k, leaves in payload["branches"].items()},
+            leaf_count=payload["leaf_count"],
+            branch_count=payload["branch_count"],
+            indexed=indexed,
+            arity=payload.get("arity", 2),
+            subtree_height=payload.get("subtree_height", 4),
+        )
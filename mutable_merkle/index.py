@@ -0,0 +1,113 @@
+from bisect import insort
+
+
+# Maps leaf hashes to their current offsets.
+#
+# Each leaf is given a sequence number when it enters the index, and a Fenwick
+# tree over the live sequence numbers converts between a sequence number and
+# the leaf's offset in O(log n). Removing a leaf only clears its sequence
+# number, so the offsets of the leaves after it shift without being rewritten.
+class LeafIndex:
+    def __init__(self, leaves=()):
+        leaves = list(leaves)
+        self._positions = {}
+        self._size = 0
+        self._dead = 0
+        self._grow(max(len(leaves), 16), live=len(leaves))
+        for seq, value in enumerate(leaves):
+            self._positions.setdefault(bytes(value), []).append(seq)
+        self._next = len(leaves)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def fragmented(self):
+        # Removed sequence numbers are only reclaimed by rebuilding the index.
+        return self._dead > max(self._size, 1024)
+
+    def _grow(self, capacity, live=None):
+        if live is None:
+            live = self._live
+        else:
+            self._size = live
+            live = bytearray(b"\x01" * live)
+
+        self._live = live + bytearray(capacity - len(live))
+        self._capacity = capacity
+
+        # Build the Fenwick tree bottom up in O(capacity).
+        tree = [0] + list(self._live)
+        for i in range(1, capacity + 1):
+            j = i + (i & -i)
+            if j <= capacity:
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _add(self, seq, delta):
+        tree = self._tree
+        i = seq + 1
+        while i <= self._capacity:
+            tree[i] += delta
+            i += i & -i
+
+    def _offset(self, seq):
+        # Live sequence numbers before and including seq, less one.
+        tree = self._tree
+        i = seq + 1
+        total = 0
+        while i:
+            total += tree[i]
+            i -= i & -i
+        return total - 1
+
+    def _seq(self, offset):
+        tree = self._tree
+        pos = 0
+        remaining = offset + 1
+        step = 1 << self._capacity.bit_length()
+        while step:
+            if pos + step <= self._capacity and tree[pos + step] < remaining:
+                pos += step
+                remaining -= tree[pos]
+            step >>= 1
+        return pos
+
+    def append(self, value):
+        seq = self._next
+        if seq == self._capacity:
+            self._grow(self._capacity * 2)
+
+        self._live[seq] = 1
+        self._add(seq, 1)
+        self._next += 1
+        self._size += 1
+        self._positions.setdefault(bytes(value), []).append(seq)
+
+    def update(self, offset, old, new):
+        seq = self._seq(offset)
+        self._discard(bytes(old), seq)
+        insort(self._positions.setdefault(bytes(new), []), seq)
+
+    def remove(self, offset, value):
+        seq = self._seq(offset)
+        self._discard(bytes(value), seq)
+        self._live[seq] = 0
+        self._add(seq, -1)
+        self._size -= 1
+        self._dead += 1
+
+    def _discard(self, key, seq):
+        seqs = self._positions[key]
+        seqs.remove(seq)
+        if not seqs:
+            del self._positions[key]
+
+    def index_of(self, value):
+        seqs = self._positions.get(bytes(value))
+        if not seqs:
+            raise ValueError("leaf is not in tree")
+        return self._offset(seqs[0])
+
+    def indices_of(self, value):
+        return [self._offset(seq) for seq in self._positions.get(bytes(value), [])]
@@ -0,0 +1,163 @@
+import functools
+import sys
+import threading
+import time
+
+
+# Public operations wrapped when a tree is instrumented.
+INSTRUMENTED = (
+    "add_leaf",
+    "update_leaf",
+    "remove_leaf",
+    "remove_leaves",
+    "truncate",
+    "extend",
+    "refresh",
+    "graft",
+    "get_proof",
+    "get_proof_for",
+    "index_of",
+    "extract_subtree",
+    "marshal",
+)
+
+
+class OperationRecord:
+    def __init__(self, name, hash_calls, nodes_hashed, elapsed):
+        self.name = name
+        # Every call to the hash function, leaves included.
+        self.hash_calls = hash_calls
+        # Internal nodes (and the root) rehashed, reads are not counted.
+        self.nodes_hashed = nodes_hashed
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return "OperationRecord(name={!r}, hash_calls={}, nodes_hashed={}, elapsed={:.6f})".format(
+            self.name, self.hash_calls, self.nodes_hashed, self.elapsed,
+        )
+
+
+class OperationStats:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.hash_calls = 0
+        self.nodes_hashed = 0
+        self.elapsed = 0.0
+
+    def add(self, record):
+        self.calls += 1
+        self.hash_calls += record.hash_calls
+        self.nodes_hashed += record.nodes_hashed
+        self.elapsed += record.elapsed
+
+    def __repr__(self):
+        return "OperationStats(name={!r}, calls={}, hash_calls={}, nodes_hashed={}, elapsed={:.6f})".format(
+            self.name, self.calls, self.hash_calls, self.nodes_hashed, self.elapsed,
+        )
+
+
+class TreeStats:
+    def __init__(self, tree, hooks=()):
+        self.tree = tree
+        self.hooks = list(hooks)
+        self.operations = {}
+        self._hashfns = None
+        # Call depth and hash counts are per thread, so concurrent readers of
+        # a ConcurrentMerkleTree are each recorded against their own calls.
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _counts(self):
+        local = self._local
+        if not hasattr(local, "depth"):
+            local.depth = 0
+            local.leaf_hashes = 0
+            local.node_hashes = 0
+        return local
+
+    def __getitem__(self, name):
+        return self.operations[name]
+
+    def record(self, record):
+        with self._lock:
+            if record.name not in self.operations:
+                self.operations[record.name] = OperationStats(record.name)
+            self.operations[record.name].add(record)
+
+        for hook in self.hooks:
+            hook(record)
+
+    def reset(self):
+        self.operations = {}
+
+    def level_bytes(self):
+        # Walks every node, so this is only computed on request.
+        return {
+            level: sys.getsizeof(nodes) + sum(sys.getsizeof(node) for node in nodes)
+            for level, nodes in self.tree.branches.items()
+        }
+
+
+def _counting(hashfn, stats, attribute):
+    # Hashes count against the calling thread. Work handed to other threads,
+    # like _hash_file's chunks, hashes with .hashfn and reports with .add().
+    def add(calls):
+        counts = stats._counts()
+        setattr(counts, attribute, getattr(counts, attribute) + calls)
+
+    def counted(value):
+        add(1)
+        return hashfn(value)
+
+    counted.hashfn = hashfn
+    counted.add = add
+    return counted
+
+
+def _timed(name, method, stats):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        # Only the outermost public call is recorded.
+        counts = stats._counts()
+        if counts.depth:
+            return method(*args, **kwargs)
+
+        leaf_hashes, node_hashes = counts.leaf_hashes, counts.node_hashes
+        counts.depth = 1
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            counts.depth = 0
+            nodes = counts.node_hashes - node_hashes
+            stats.record(OperationRecord(name, counts.leaf_hashes - leaf_hashes + nodes, nodes, elapsed))
+    return wrapper
+
+
+def instrument(tree, hooks=()):
+    # Instrumentation lives entirely in instance attributes that shadow the
+    # class methods, so an uninstrumented tree pays nothing for it.
+    uninstrument(tree)
+
+    stats = TreeStats(tree, hooks)
+    stats._hashfns = (tree._hashfn, tree._leaf_hashfn)
+    tree._stats = stats
+    tree._hashfn = _counting(tree._hashfn, stats, "node_hashes")
+    tree._leaf_hashfn = _counting(tree._leaf_hashfn, stats, "leaf_hashes")
+    for name in INSTRUMENTED:
+        setattr(tree, name, _timed(name, getattr(tree, name), stats))
+
+    return stats
+
+
+def uninstrument(tree):
+    if getattr(tree, "_stats", None) is None:
+        return
+
+    stats = tree._stats
+    for name in INSTRUMENTED:
+        tree.__dict__.pop(name, None)
+    tree._hashfn, tree._leaf_hashfn = stats._hashfns
+    tree._stats = None
@@ -0,0 +1,246 @@
+import sqlite3
+from collections.abc import MutableSequence
+
+from mutable_merkle.tree import MerkleTree
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    level INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (level, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS levels (
+    level INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+
+# One tree level backed by the nodes table. Rows are read on first use and
+# kept in a write-back cache; writes only mark the index dirty until the tree
+# is committed. Every index below len() that is not cached is stored in the
+# table at the same index.
+class Level(MutableSequence):
+    def __init__(self, connection, level, length=0, stored=0):
+        self._connection = connection
+        self._level = level
+        self._length = length
+        # Rows in the table, anything at or past it is deleted on flush.
+        self._stored = stored
+        self._cache = {}
+        self._dirty = set()
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "Level(level={}, length={})".format(self._level, self._length)
+
+    def _load(self, start, stop):
+        missing = [i for i in range(start, stop) if i not in self._cache]
+        if not missing:
+            return
+
+        rows = self._connection.execute(
+            "SELECT idx, value FROM nodes WHERE level = ? AND idx >= ? AND idx <= ?",
+            (self._level, missing[0], missing[-1]),
+        )
+        for idx, value in rows:
+            self._cache.setdefault(idx, value)
+
+    def _index(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("level index out of range")
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            self._load(start, stop)
+            return [self._cache[i] for i in range(start, stop, step)]
+
+        index = self._index(index)
+        if index not in self._cache:
+            self._load(index, index + 1)
+        return self._cache[index]
+
+    def __setitem__(self, index, value):
+        if not isinstance(index, slice):
+            index = self._index(index)
+            self._cache[index] = value
+            self._dirty.add(index)
+            return
+
+        start, stop, step = index.indices(self._length)
+        if step != 1:
+            raise ValueError("extended slices are not supported")
+
+        values = list(value)
+        stop = max(start, stop)
+        if len(values) != stop - start:
+            # A resize shifts every node after the slice, load them so the
+            # shifted values are all in the cache.
+            values.extend(self[stop:])
+            for i in range(start, self._length):
+                self._cache.pop(i, None)
+            self._dirty.difference_update(range(start, self._length))
+            self._length = start + len(values)
+
+        for offset, value in enumerate(values, start):
+            self._cache[offset] = value
+        self._dirty.update(range(start, start + len(values)))
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            self[index] = []
+        else:
+            index = self._index(index)
+            self[index:index + 1] = []
+
+    def insert(self, index, value):
+        self[index:index] = [value]
+
+    def append(self, value):
+        self._cache[self._length] = value
+        self._dirty.add(self._length)
+        self._length += 1
+
+    def flush(self, cache_size):
+        if self._length < self._stored:
+            self._connection.execute(
+                "DELETE FROM nodes WHERE level = ? AND idx >= ?",
+                (self._level, self._length),
+            )
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO nodes (level, idx, value) VALUES (?, ?, ?)",
+            [(self._level, i, bytes(self._cache[i])) for i in sorted(self._dirty) if i < self._length],
+        )
+        self._dirty.clear()
+        self._stored = self._length
+
+        if len(self._cache) > cache_size:
+            self._cache.clear()
+
+
+# The branches mapping of a SQLiteMerkleTree. Lists assigned to it become
+# Levels, and levels replaced or removed are cleared from the table on flush.
+class Levels(dict):
+    def __init__(self, connection):
+        super().__init__()
+        self._connection = connection
+        self._removed = set()
+
+    def __setitem__(self, level, nodes):
+        if not isinstance(nodes, Level):
+            self._removed.add(level)
+            values = nodes
+            nodes = Level(self._connection, level)
+            nodes[:] = values
+        super().__setitem__(level, nodes)
+
+    def __delitem__(self, level):
+        super().__delitem__(level)
+        self._removed.add(level)
+
+    def pop(self, level, *default):
+        if level in self:
+            self._removed.add(level)
+        return super().pop(level, *default)
+
+    def clear(self):
+        self._removed.update(self)
+        super().clear()
+
+    def flush(self, cache_size):
+        for level in sorted(self._removed):
+            self._connection.execute("DELETE FROM nodes WHERE level = ?", (level,))
+            self._connection.execute("DELETE FROM levels WHERE level = ?", (level,))
+        self._removed.clear()
+
+        for level, nodes in self.items():
+            nodes.flush(cache_size)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO levels (level, length) VALUES (?, ?)",
+                (level, len(nodes)),
+            )
+
+
+# A MerkleTree whose nodes live in a SQLite database, keyed by (level, index).
+#
+# Opening a file only reads the tree's metadata, nodes are loaded as they are
+# used. Changes stay in memory until commit(), which writes the dirty nodes,
+# O(log n) per updated leaf, in a single transaction. close() does not commit.
+class SQLiteMerkleTree(MerkleTree):
+    def __init__(self, *args, connection=None, cache_size=1 << 20, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._connection = connection or sqlite3.connect(":memory:")
+        self._connection.executescript(SCHEMA)
+        # Clean cached nodes are dropped at commit past this many per level.
+        self._cache_size = cache_size
+
+        branches = self.branches
+        self.branches = Levels(self._connection)
+        for level, nodes in branches.items():
+            self.branches[level] = nodes
+
+    @classmethod
+    def open(cls, path, hash_type="sha256", arity=2, indexed=False, cache_size=1 << 20):
+        # hash_type and arity only apply to a new file, an existing tree keeps
+        # the ones it was created with.
+        connection = sqlite3.connect(path)
+        connection.executescript(SCHEMA)
+        meta = dict(connection.execute("SELECT key, value FROM meta"))
+        if not meta:
+            return cls(hash_type, arity=arity, indexed=indexed, connection=connection, cache_size=cache_size)
+
+        mt = cls(
+            meta["hash_type"],
+            root=bytearray(meta["root"]),
+            leaf_count=meta["leaf_count"],
+            branch_count=meta["branch_count"],
+            arity=meta["arity"],
+            connection=connection,
+            cache_size=cache_size,
+        )
+        for level, length in connection.execute("SELECT level, length FROM levels"):
+            dict.__setitem__(mt.branches, level, Level(connection, level, length, length))
+
+        if indexed:
+            mt.build_index()
+
+        return mt
+
+    def commit(self):
+        with self._connection:
+            self.branches.flush(self._cache_size)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [
+                    ("hash_type", self._hash_type),
+                    ("root", bytes(self.root)),
+                    ("leaf_count", self._leaf_count),
+                    ("branch_count", self._branch_count),
+                    ("arity", self._arity),
+                ],
+            )
+
+    def close(self):
+        self._connection.close()
+
+    def __reduce_ex__(self, protocol):
+        raise TypeError("SQLiteMerkleTree cannot be pickled, reopen it from its database instead")
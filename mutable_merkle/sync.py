@@ -0,0 +1,167 @@
+import functools
+import threading
+from contextlib import contextmanager
+
+from mutable_merkle.tree import MerkleTree
+
+
+# Many concurrent readers, one writer. Writers are preferred: once a writer
+# is waiting new readers queue behind it, so a steady stream of proofs cannot
+# starve updates. Both sides are reentrant, and the writing thread may read.
+class ReadWriteLock:
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        # Read depth per thread, and the threads counted in _readers. These
+        # are keyed by thread rather than thread local so a read can be
+        # released on behalf of the thread that acquired it.
+        self._depths = {}
+        self._counted = set()
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            depth = self._depths.get(me, 0)
+            if not depth and self._writer != me:
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+                self._readers += 1
+                self._counted.add(me)
+            self._depths[me] = depth + 1
+        return me
+
+    def release_read(self, owner=None):
+        # owner is the ident returned by acquire_read, for a release that may
+        # run on another thread.
+        if owner is None:
+            owner = threading.get_ident()
+
+        with self._cond:
+            depth = self._depths.pop(owner) - 1
+            if depth:
+                self._depths[owner] = depth
+                return
+
+            if owner in self._counted:
+                self._counted.remove(owner)
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+
+        if me in self._counted:
+            raise RuntimeError("cannot upgrade a read lock to a write lock")
+
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        self._write_depth -= 1
+        if self._write_depth:
+            return
+
+        with self._cond:
+            # Reads the writer took and still holds, such as an open
+            # iter_proofs(), outlive the write and now count as a reader.
+            if self._writer in self._depths:
+                self._counted.add(self._writer)
+                self._readers += 1
+            self._writer = None
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def _reader(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock.read():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _iter_reader(method):
+    # Generators run after the call returns, so the read lock is held until
+    # the iteration finishes (or the generator is closed). Closing or garbage
+    # collecting the generator can happen on any thread, so the release names
+    # the thread that acquired.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        owner = self._lock.acquire_read()
+        try:
+            yield from method(self, *args, **kwargs)
+        finally:
+            self._lock.release_read(owner)
+    return wrapper
+
+
+def _writer(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock.write():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# Reads run concurrently and never observe a partially applied mutation, so
+# every proof is pinned to the root published by the last completed write.
+# ``read()``/``write()`` group several calls into one view or one update.
+class ConcurrentMerkleTree(MerkleTree):
+    def __init__(self, *args, **kwargs):
+        self._lock = ReadWriteLock()
+        super().__init__(*args, **kwargs)
+
+    def read(self):
+        return self._lock.read()
+
+    def write(self):
+        return self._lock.write()
+
+    __eq__ = _reader(MerkleTree.__eq__)
+    __len__ = _reader(MerkleTree.__len__)
+
+    add_leaf = _writer(MerkleTree.add_leaf)
+    update_leaf = _writer(MerkleTree.update_leaf)
+    remove_leaf = _writer(MerkleTree.remove_leaf)
+    remove_leaves = _writer(MerkleTree.remove_leaves)
+    truncate = _writer(MerkleTree.truncate)
+    extend = _writer(MerkleTree.extend)
+    build_index = _writer(MerkleTree.build_index)
+    refresh = _writer(MerkleTree.refresh)
+    graft = _writer(MerkleTree.graft)
+
+    get_proof = _reader(MerkleTree.get_proof)
+    get_proof_for = _reader(MerkleTree.get_proof_for)
+    index_of = _reader(MerkleTree.index_of)
+    indices_of = _reader(MerkleTree.indices_of)
+    extract_subtree = _reader(MerkleTree.extract_subtree)
+    iter_proofs = _iter_reader(MerkleTree.iter_proofs)
+    marshal = _reader(MerkleTree.marshal)
+    __reduce_ex__ = _reader(MerkleTree.__reduce_ex__)
@@ -1,44 +1,212 @@
-from mutable_merkle import util
+import mmap
+import os
+import pickle
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from mutable_merkle import (
+    stats,
+    util,
+)
+from mutable_merkle.index import LeafIndex
+
+
+# Out-of-band pickle buffers, Python 3.8+.
+PickleBuffer = getattr(pickle, "PickleBuffer", None)
+
+
+def _build_many(leaf_lists, hash_type, hashed, arity, roots_only):
+    # Build the levels of each tree in one tight loop, without going through
+    # MerkleTree's per-node methods. Nodes are kept as bytes and children are
+    # grouped with zip, both noticeably cheaper than bytearrays and slices for
+    # small trees. Module level so process pools can pickle it.
+    #
+    # Returns (root, branches, leaf_count, branch_count) per tree, branches
+    # being None for roots only.
+    hashfn = util.get_hashfn(hash_type)
+    empty = bytes(util.get_hash_len(hash_type))
+    shift = arity.bit_length() - 1
+    built = []
+
+    for leaves in leaf_lists:
+        if hashed:
+            leaves = [bytes(leaf) for leaf in leaves]
+        else:
+            leaves = [hashfn(leaf).digest() for leaf in leaves]
+
+        leaf_count = len(leaves)
+        if leaf_count == 0:
+            built.append((bytearray(empty), None if roots_only else {}, 0, 0))
+            continue
+
+        depth = max(1, -(-(leaf_count - 1).bit_length() // shift))
+        branches = {0: leaves}
+        nodes = leaves
+        for branch_index in range(1, depth + 1):
+            children = iter(nodes + [empty] * (-len(nodes) % arity))
+            if arity == 2:
+                nodes = [hashfn(left + right).digest() for left, right in zip(children, children)]
+            else:
+                nodes = [hashfn(b"".join(group)).digest() for group in zip(*[children] * arity)]
+            if not roots_only and branch_index < depth:
+                branches[branch_index] = nodes
+
+        if not roots_only:
+            # A lone node keeps its empty sibling.
+            for level in branches.values():
+                if len(level) == 1:
+                    level.append(empty)
+        built.append((bytearray(nodes[0]), None if roots_only else branches, leaf_count, depth))
+
+    return built
+
+
+def _hash_file(path, chunk_size, hashfn, workers=None):
+    # Hash a file in chunk_size chunks straight from an mmap. Chunks are
+    # memoryview slices, so nothing is copied, and hashlib releases the GIL
+    # while hashing them, so threads hash chunks in parallel. An instrumented
+    # hashfn counts per thread, so the chunks are added to the caller's count.
+    count = getattr(hashfn, "add", None)
+    hashfn = getattr(hashfn, "hashfn", hashfn)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            def hash_chunk(start):
+                return hashfn(view[start:start + chunk_size]).digest()
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                leaves = list(executor.map(hash_chunk, range(0, size, chunk_size)))
+
+    if count is not None:
+        count(len(leaves))
+    return leaves
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
 
 
 class MerkleTree:
     @classmethod
-    def new(cls, leaves, hash_type, hashed=False):
-        mt = cls(hash_type)
+    def new(cls, leaves, hash_type, hashed=False, indexed=False, arity=2):
+        return cls(hash_type, indexed=indexed, arity=arity)._build(leaves, hashed)
+
+    @classmethod
+    def new_many(cls, leaf_lists, hash_type, hashed=False, arity=2, executor=None, chunk_size=1024):
+        # Many small trees at once. With an executor, chunks of chunk_size
+        # trees are built in parallel; hashing small leaves holds the GIL, so
+        # use a ProcessPoolExecutor for a speedup.
+        return [
+            cls(
+                hash_type,
+                root=root,
+                branches=branches,
+                leaf_count=leaf_count,
+                branch_count=branch_count,
+                arity=arity,
+            )
+            for root, branches, leaf_count, branch_count in cls._build_many(
+                leaf_lists, hash_type, hashed, arity, False, executor, chunk_size,
+            )
+        ]
+
+    @classmethod
+    def roots_many(cls, leaf_lists, hash_type, hashed=False, arity=2, executor=None, chunk_size=1024):
+        # As new_many, returning only each tree's root.
+        return [
+            root
+            for root, _, _, _ in cls._build_many(leaf_lists, hash_type, hashed, arity, True, executor, chunk_size)
+        ]
+
+    @staticmethod
+    def _build_many(leaf_lists, hash_type, hashed, arity, roots_only, executor, chunk_size):
+        if executor is None:
+            return _build_many(leaf_lists, hash_type, hashed, arity, roots_only)
+
+        leaf_lists = list(leaf_lists)
+        chunks = [leaf_lists[i:i + chunk_size] for i in range(0, len(leaf_lists), chunk_size)]
+        futures = [executor.submit(_build_many, chunk, hash_type, hashed, arity, roots_only) for chunk in chunks]
+        return [built for future in futures for built in future.result()]
+
+    @classmethod
+    def from_file(cls, path, chunk_size=1 << 20, hash_type="sha256", workers=None, arity=2):
+        # One leaf per chunk_size chunk of the file, the last may be shorter.
+        signature = _file_signature(path)
+        mt = cls(hash_type, arity=arity)
+        mt._build(_hash_file(path, chunk_size, mt._leaf_hashfn, workers), hashed=True)
+        mt._chunk_size = chunk_size
+        mt._file_signature = signature
+        return mt
 
+    def refresh(self, path, workers=None):
+        # Bring a from_file tree up to date with the file. An unchanged size
+        # and mtime skips the file entirely, otherwise every chunk is rehashed
+        # and only the leaves that differ are updated, with the tree extended
+        # or truncated to the new chunk count. Returns the offsets written.
+        if self._chunk_size is None:
+            raise ValueError("tree was not built with from_file")
+
+        signature = _file_signature(path)
+        if signature == self._file_signature:
+            return []
+
+        leaves = _hash_file(path, self._chunk_size, self._leaf_hashfn, workers)
+        current = self.branches[0][:self._leaf_count] if self._leaf_count else []
+        changed = [offset for offset, (old, new) in enumerate(zip(current, leaves)) if old != new]
+        for offset in changed:
+            self.update_leaf(leaves[offset], offset, hashed=True)
+
+        if len(leaves) < self._leaf_count:
+            self.truncate(len(leaves))
+        elif len(leaves) > self._leaf_count:
+            changed.extend(range(self._leaf_count, len(leaves)))
+            self.extend(leaves[self._leaf_count:], hashed=True)
+
+        self._file_signature = signature
+        return changed
+
+    def _build(self, leaves, hashed):
+        # Fill an empty tree with leaves in a single pass.
         if not leaves:
-            return mt
+            return self
 
         if not hashed:
-            leaves = [util.hash(leaf, mt._hashfn) for leaf in leaves]
+            leaves = [util.hash(leaf, self._leaf_hashfn) for leaf in leaves]
 
-        mt._leaf_count = len(leaves)
+        self._leaf_count = len(leaves)
 
-        base_count = 1 << (len(leaves) - 1).bit_length()
-
-        if base_count == 1:
-            mt._add_branch()
+        for _ in range(self._depth(self._leaf_count)):
+            self._add_branch()
 
-        else:
-            branch_index = 0
-            while base_count > 1:
-                mt.branches[branch_index] = [mt._empty, mt._empty]
-                base_count = int(base_count / 2)
-                branch_index += 1
-                mt._branch_count += 1
-
-        mt.branches[0] = leaves
+        self.branches[0] = list(leaves)
         if len(leaves) == 1:
-            mt.branches[0].append(mt._empty)
+            self.branches[0].append(self._empty)
 
-        mt._rebuild_branch(0, 0, mt._leaf_count - 1)
+        self._rebuild_branch(0, 0, self._leaf_count - 1)
 
-        return mt
+        if self._index is not None:
+            self.build_index()
+
+        return self
+
+    def __init__(self, hash_type, root=None, branches=None, leaf_count=0, branch_count=0, indexed=False, arity=2):
+        if arity < 2 or arity & (arity - 1):
+            raise ValueError("arity must be a power of two")
 
-    def __init__(self, hash_type, root=None, branches=None, leaf_count=0, branch_count=0):
         self._hash_type = hash_type
         self._hash_len = util.get_hash_len(hash_type)
         self._hashfn = util.get_hashfn(hash_type)
+        # Leaves are hashed separately from internal nodes so instrumentation
+        # can tell the two apart.
+        self._leaf_hashfn = self._hashfn
+
+        # Children per node, and log2 of it for index arithmetic.
+        self._arity = arity
+        self._shift = arity.bit_length() - 1
 
         self._empty = bytearray(self._hash_len)
         self.root = root or self._empty
@@ -46,26 +214,70 @@ class MerkleTree:
         self._leaf_count = leaf_count
         self.branches = branches or {}
 
+        self._index = None
+        if indexed:
+            self.build_index()
+
+        # Set by from_file, for refresh.
+        self._chunk_size = None
+        self._file_signature = None
+
     def __eq__(self, other):
         return type(self) == type(other) and self.root == other.root
 
     def __len__(self):
         return self._leaf_count
 
+    def instrument(self, hooks=()):
+        return stats.instrument(self, hooks)
+
+    def uninstrument(self):
+        stats.uninstrument(self)
+
+    def build_index(self):
+        self._index = LeafIndex(self.branches[0][:self._leaf_count] if self._leaf_count else ())
+
+    def index_of(self, value, hashed=False):
+        if not hashed:
+            value = util.hash(value, self._leaf_hashfn)
+
+        if self._index is not None:
+            return self._index.index_of(value)
+
+        # Without an index fall back to scanning the leaves.
+        for offset in range(self._leaf_count):
+            if self.branches[0][offset] == value:
+                return offset
+        raise ValueError("leaf is not in tree")
+
+    def indices_of(self, value, hashed=False):
+        if not hashed:
+            value = util.hash(value, self._leaf_hashfn)
+
+        if self._index is not None:
+            return self._index.indices_of(value)
+
+        return [offset for offset in range(self._leaf_count) if self.branches[0][offset] == value]
+
+    def get_proof_for(self, value, hashed=False):
+        return self.get_proof(self.index_of(value, hashed=hashed))
+
     def _add_branch(self):
         self.branches[self._branch_count] = [self.root, self._empty]
         self._branch_count += 1
 
     def add_leaf(self, value, hashed=False):
         if not hashed:
-            value = util.hash(value, self._hashfn)
+            value = util.hash(value, self._leaf_hashfn)
 
-        if self._branch_count == 0 or self._leaf_count + 1 > self._branch_size(0):
+        if self._branch_count == 0 or self._leaf_count + 1 > self._capacity():
             self._add_branch()
 
         index = self._leaf_count
 
         self._update_branch(value, index, 0)
+        if self._index is not None:
+            self._index.append(value)
 
         self._leaf_count += 1
 
@@ -76,19 +288,14 @@ class MerkleTree:
             raise IndexError("assignment index out of range")
 
         if not hashed:
-            value = util.hash(value, self._hashfn)
+            value = util.hash(value, self._leaf_hashfn)
+
+        if self._index is not None:
+            self._index.update(offset, self.branches[0][offset], value)
 
         self._update_branch(value, offset, 0)
         self._update_parent(value, offset, 0)
 
-    def _prune_branch(self, branch_index):
-        self.branches[branch_index] = self.branches[branch_index][:int(self._branch_size(branch_index) / 2)]  # noqa
-
-    def _remove_branch(self):
-        self.root = self.branches[self._branch_count - 1][0]
-        del self.branches[self._branch_count - 1]
-        self._branch_count -= 1
-
     def remove_leaf(self, offset):
         if self._leaf_count == 0:
             raise IndexError("pop from empty list")
@@ -96,39 +303,305 @@ class MerkleTree:
         if offset >= self._leaf_count:
             raise IndexError("pop index out of range")
 
+        if self._index is not None:
+            self._index.remove(offset, self.branches[0][offset])
+
         del self.branches[0][offset]
         self.branches[0].append(self._empty)
         self._leaf_count -= 1
 
         if self._leaf_count == 0:
-            self._remove_branch()
-            self.root = self._empty
-        elif self._leaf_count > 1 and self._leaf_count <= self._branch_size(0) >> 1:
-            for i in range(self._branch_count):
-                self._prune_branch(i)
-            self._remove_branch()
+            self._clear()
+        else:
+            depth = self._depth(self._leaf_count)
+            if depth < self._branch_count:
+                self._shrink(depth)
 
-        if self._branch_count > 0:
-            offset = offset - 1 if offset == self._branch_size(0) else offset
+            self._rebuild_branch(0, min(offset, self._leaf_count - 1), self._leaf_count - 1)
 
-            self._rebuild_branch(0, offset, self._leaf_count - 1)
+        if self._index is not None and self._index.fragmented:
+            self.build_index()
 
-    def _update_parent(self, value, index, branch_index, recurse=True):
-        sibling = self._get_sibling(index, branch_index)
+    def remove_leaves(self, offsets):
+        offsets = sorted(set(offsets))
+        if not offsets:
+            return
 
-        if self._side(index) == "L":
-            left, right = value, sibling
+        if self._leaf_count == 0:
+            raise IndexError("pop from empty list")
+
+        if offsets[0] < 0 or offsets[-1] >= self._leaf_count:
+            raise IndexError("pop index out of range")
+
+        leaves = self.branches[0]
+        if self._index is not None:
+            for offset in reversed(offsets):
+                self._index.remove(offset, leaves[offset])
+
+        # Compact the leaves once, only the tail after the first offset moves.
+        start = offsets[0]
+        kept = []
+        for offset in offsets:
+            kept.extend(leaves[start:offset])
+            start = offset + 1
+        kept.extend(leaves[start:self._leaf_count])
+        leaves[offsets[0]:] = kept
+
+        self._leaf_count -= len(offsets)
+        if self._leaf_count == 0:
+            self._clear()
         else:
-            left, right = sibling, value
+            self._shrink(self._depth(self._leaf_count))
+            self._rebuild_branch(0, min(offsets[0], self._leaf_count - 1), self._leaf_count - 1)
 
-        parent = util.combine(left, right, self._hashfn)
-        parent_index = self._parent_index(index)
-        if branch_index + 1 == self._branch_count:
-            self.root = parent
+        if self._index is not None and self._index.fragmented:
+            self.build_index()
+
+    def truncate(self, size):
+        if size < 0:
+            raise ValueError("size must not be negative")
+
+        if size >= self._leaf_count:
+            return
+
+        if self._index is not None:
+            for offset in range(self._leaf_count - 1, size - 1, -1):
+                self._index.remove(offset, self.branches[0][offset])
+
+        del self.branches[0][size:]
+        self._leaf_count = size
+
+        if size == 0:
+            self._clear()
+        else:
+            # Only the nodes on the new right edge change.
+            self._shrink(self._depth(size))
+            self._rebuild_branch(0, size - 1, size - 1)
+
+        if self._index is not None and self._index.fragmented:
+            self.build_index()
+
+    def extend(self, values, hashed=False):
+        if not hashed:
+            values = [util.hash(value, self._leaf_hashfn) for value in values]
+        else:
+            values = list(values)
+
+        if not values:
+            return
+
+        start = self._leaf_count
+        leaf_count = start + len(values)
+        while self._branch_count < self._depth(leaf_count):
+            self._add_branch()
+
+        self.branches[0][start:] = values
+        if self._index is not None:
+            for value in values:
+                self._index.append(value)
+        self._leaf_count = leaf_count
+
+        self._rebuild_branch(0, start, leaf_count - 1)
+
+    def graft(self, subtree, offset):
+        # Copy a prebuilt subtree's levels in as the leaves from offset and
+        # rehash only its ancestors. The subtree covers an aligned block of
+        # arity ** depth leaves; a block that is not full must end the tree.
+        self._check_graft(subtree, offset)
+
+        leaf_count = len(subtree)
+        depth = subtree._branch_count
+        tail = offset + leaf_count >= self._leaf_count
+
+        if self._index is not None:
+            self._index_leaves(offset, subtree.branches[0][:leaf_count])
+
+        if offset == 0 and tail:
+            # The subtree replaces the whole tree.
+            self.branches.clear()
+            for branch_index, nodes in self._stored_levels(subtree):
+                # A lone node keeps its empty sibling.
+                if len(nodes) == 1:
+                    nodes.append(self._empty)
+                self.branches[branch_index] = nodes
+            self.root = subtree.root
+            self._branch_count = depth
+            self._leaf_count = leaf_count
+            return
+
+        self._leaf_count = max(self._leaf_count, offset + leaf_count)
+        while self._branch_count < self._depth(self._leaf_count):
+            self._add_branch()
+
+        for branch_index, nodes in self._stored_levels(subtree):
+            start = offset >> self._shift * branch_index
+            self.branches[branch_index][start:start + len(nodes)] = nodes
+
+        if self._dropped(depth):
+            # The subtree's root is on a level this tree does not store, so
+            # its ancestors are rehashed up from the leaves.
+            if tail:
+                self._rebuild_branch(0, offset, offset + leaf_count - 1)
+            else:
+                self._update_parent(subtree.root, offset, 0)
+            return
+
+        index = offset >> self._shift * depth
+        self._update_branch(subtree.root, index, depth)
+        if tail:
+            # The subtree is the new right edge, drop anything past it.
+            self._rebuild_branch(depth, index, index)
+        else:
+            self._update_parent(subtree.root, index, depth)
+
+    def _stored_levels(self, subtree):
+        # The subtree's nodes on each level this tree stores, read through
+        # _get where a HybridMerkleTree subtree dropped the level.
+        leaf_count = len(subtree)
+        for branch_index in range(subtree._branch_count):
+            if self._dropped(branch_index):
+                continue
+
+            count = -(-leaf_count >> self._shift * branch_index)
+            if branch_index in subtree.branches:
+                yield branch_index, subtree.branches[branch_index][:count]
+            else:
+                yield branch_index, [subtree._get(i, branch_index) for i in range(count)]
+
+    def _dropped(self, branch_index):
+        # Levels not kept in branches, see HybridMerkleTree.
+        return False
+
+    def _check_graft(self, subtree, offset):
+        if subtree._hash_type != self._hash_type or subtree._arity != self._arity:
+            raise ValueError("subtree must have the same hash type and arity")
+
+        if len(subtree) == 0:
+            raise ValueError("cannot graft an empty subtree")
+
+        width = 1 << self._shift * subtree._branch_count
+        if offset % width:
+            raise ValueError("offset must be aligned to the subtree's width")
+
+        if offset > self._leaf_count:
+            raise IndexError("graft offset out of range")
+
+        if offset + len(subtree) < self._leaf_count and len(subtree) < width:
+            raise ValueError("only the last subtree of a tree can be partially filled")
+
+    def _index_leaves(self, offset, values):
+        # Index values written from offset, over existing leaves or appended.
+        old = self.branches[0][offset:self._leaf_count] if self._leaf_count else []
+        for i, (before, after) in enumerate(zip(old, values)):
+            self._index.update(offset + i, before, after)
+        for value in values[len(old):]:
+            self._index.append(value)
+
+    def extract_subtree(self, offset, size):
+        # A standalone tree over the aligned block of size leaves from offset,
+        # copied from this tree's levels. size must be a power of the arity;
+        # a block past the last leaf is cut short.
+        leaf_count, depth = self._check_extract(offset, size)
+
+        branches = {}
+        for branch_index in range(depth):
+            start = offset >> self._shift * branch_index
+            count = -(-leaf_count >> self._shift * branch_index)
+            branches[branch_index] = self.branches[branch_index][start:start + count]
+            # A lone node keeps its empty sibling.
+            if count == 1:
+                branches[branch_index].append(self._empty)
+
+        if depth == self._branch_count:
+            root = self.root
         else:
-            self._update_branch(parent, parent_index, branch_index + 1)
-            if recurse:
-                self._update_parent(parent, parent_index, branch_index + 1)
+            root = self.branches[depth][offset >> self._shift * depth]
+
+        return type(self)(
+            self._hash_type,
+            root=root,
+            branches=branches,
+            leaf_count=leaf_count,
+            branch_count=depth,
+            arity=self._arity,
+        )
+
+    def _check_extract(self, offset, size):
+        # The leaf count and depth of the block to extract.
+        depth = (size.bit_length() - 1) // self._shift
+        if size < self._arity or size != 1 << self._shift * depth:
+            raise ValueError("size must be a power of the tree's arity")
+
+        if offset % size:
+            raise ValueError("offset must be aligned to size")
+
+        if offset >= self._leaf_count:
+            raise IndexError("subtree offset out of range")
+
+        leaf_count = min(size, self._leaf_count - offset)
+        return leaf_count, self._depth(leaf_count)
+
+    def _depth(self, leaf_count):
+        # Levels below the root needed for leaf_count leaves.
+        return max(1, -(-(leaf_count - 1).bit_length() // self._shift))
+
+    def _capacity(self, branch_index=0):
+        return 1 << self._shift * (self._branch_count - branch_index)
+
+    def _shrink(self, branch_count):
+        # Drop the levels above branch_count, and the nodes beyond each
+        # remaining level's width. The root is recomputed by the caller.
+        for branch_index in list(self.branches):
+            if branch_index >= branch_count:
+                del self.branches[branch_index]
+            else:
+                del self.branches[branch_index][1 << self._shift * (branch_count - branch_index):]
+        self._branch_count = min(branch_count, self._branch_count)
+
+    def _clear(self):
+        self.branches.clear()
+        self._branch_count = 0
+        self._leaf_count = 0
+        self.root = self._empty
+
+    def _update_parent(self, value, index, branch_index):
+        # Walk from a node up to the root, rehashing each parent from the new
+        # value and its stored siblings. Locals avoid per-level attribute and
+        # method lookups, which cost about as much as the hashing itself.
+        branches = self.branches
+        hashfn = self._hashfn
+        empty = self._empty
+        arity = self._arity
+        shift = self._shift
+        top = self._branch_count - 1
+
+        while True:
+            nodes = branches[branch_index]
+            # Binary trees skip building the sibling group.
+            if arity == 2 and index & 1:
+                value = bytearray(hashfn(nodes[index - 1] + value).digest())
+            elif arity == 2:
+                sibling = nodes[index + 1] if index + 1 < len(nodes) else empty
+                value = bytearray(hashfn(value + sibling).digest())
+            else:
+                first = index >> shift << shift
+                group = nodes[first:first + arity]
+                if len(group) < arity:
+                    group.extend([empty] * (arity - len(group)))
+                group[index - first] = value
+                value = bytearray(hashfn(b"".join(group)).digest())
+
+            if branch_index == top:
+                self.root = value
+                return
+
+            index >>= shift
+            branch_index += 1
+            nodes = branches[branch_index]
+            if index < len(nodes):
+                nodes[index] = value
+            else:
+                nodes.append(value)
 
     def _get_sibling_index(self, index):
         if self._side(index) == "L":
@@ -138,11 +611,6 @@ class MerkleTree:
 
         return sibling_index
 
-    def _get_sibling(self, index, branch_index):
-        sibling_index = self._get_sibling_index(index)
-
-        return self._get(sibling_index, branch_index)
-
     def _get(self, offset, branch_index):
         if offset < len(self.branches[branch_index]):
             return self.branches[branch_index][offset]
@@ -157,48 +625,101 @@ class MerkleTree:
             target.append(value)
 
     def _rebuild_branch(self, branch_index, start_index, end_index):
-        # From the last leaf, zero out any values that used to be populated
-        orphaned_leaf_count = self._branch_size(branch_index) - (end_index + 1)
-        if orphaned_leaf_count > 0:
-            keep_index = (self._branch_size(branch_index) - orphaned_leaf_count)
-            self.branches[branch_index] = self.branches[branch_index][:keep_index]
-            if start_index == 0 and end_index == 0:
-                self.branches[branch_index].append(self._empty)
-
-        start_index = start_index if self._side(start_index) == "L" else start_index - 1
-        # Ensure we include the final sibbling in the loop.
-        end_index = end_index if self._side(end_index) == "R" else end_index + 1
-
-        for index in range(start_index, end_index, 2):
-            value = self._get(index, branch_index)
-            self._update_parent(value, index, branch_index, recurse=False)
-
-        start_index = self._parent_index(start_index)
-        end_index = self._parent_index(end_index)
-        if branch_index + 1 < self._branch_count:
-            self._rebuild_branch(branch_index + 1, start_index, end_index)
+        # Rehash every parent covering [start_index, end_index], one level at a
+        # time from branch_index to the root.
+        branches = self.branches
+        hashfn = self._hashfn
+        empty = self._empty
+        arity = self._arity
+        shift = self._shift
+        branch_count = self._branch_count
+
+        while branch_index < branch_count:
+            nodes = branches[branch_index]
+            # From the last leaf, zero out any values that used to be populated
+            if end_index + 1 < 1 << shift * (branch_count - branch_index):
+                del nodes[end_index + 1:]
+                # A lone node keeps its empty sibling.
+                if end_index == 0:
+                    nodes.append(empty)
+
+            start_index = start_index >> shift << shift
+            # Ensure we include the final siblings in the range.
+            stop_index = (end_index >> shift << shift) + arity
+
+            children = nodes[start_index:stop_index]
+            children.extend([empty] * (stop_index - start_index - len(children)))
+            if arity == 2:
+                # Binary trees pair children with zip, cheaper than slicing.
+                children = iter(children)
+                parents = [bytearray(hashfn(left + right).digest()) for left, right in zip(children, children)]
+            else:
+                parents = [
+                    bytearray(hashfn(b"".join(children[i:i + arity])).digest())
+                    for i in range(0, len(children), arity)
+                ]
+
+            if branch_index + 1 == branch_count:
+                if parents:
+                    self.root = parents[-1]
+            else:
+                parent_index = start_index >> shift
+                branches[branch_index + 1][parent_index:parent_index + len(parents)] = parents
+
+            start_index >>= shift
+            end_index >>= shift
+            branch_index += 1
 
     def _side(self, index):
         return "R" if index & 1 else "L"
 
-    def _parent_index(self, index):
-        return index >> 1
-
     def _branch_size(self, branch_index):
         leaf_count = len(self.branches[branch_index])
-        return 1 << (leaf_count - 1).bit_length()
+        return 1 << -(-(leaf_count - 1).bit_length() // self._shift) * self._shift
+
+    def _proof_entry(self, index, branch_index):
+        if self._arity == 2:
+            sibling_index = self._get_sibling_index(index)
+            sibling = self._get(sibling_index, branch_index)
+            return [self._side(sibling_index), bytes(sibling)]
+
+        # k-ary levels list the other children of the group in order, with
+        # the position the proven node takes among them.
+        first = index >> self._shift << self._shift
+        siblings = [bytes(self._get(i, branch_index)) for i in range(first, first + self._arity) if i != index]
+        return [index - first, siblings]
 
     def get_proof(self, index):
         chain = [self._hash_type.encode().hex()]
         for branch_index in range(self._branch_count):
-            sibling_index = self._get_sibling_index(index)
-            sibling = self._get(sibling_index, branch_index)
-            chain.append([self._side(sibling_index), bytes(sibling)])
-            index = self._parent_index(index)
+            chain.append(self._proof_entry(index, branch_index))
+            index >>= self._shift
         chain.append(["ROOT", bytes(self.root)])
 
         return chain
 
+    def iter_proofs(self, start=0, end=None):
+        # Proofs for leaves [start, end) in index order, each as get_proof
+        # would return it. An entry above the leaf level only changes when the
+        # walk moves into the next subtree, so it is built once and shared by
+        # every proof beneath it; treat the entries as read only.
+        end = self._leaf_count if end is None else min(end, self._leaf_count)
+        header = self._hash_type.encode().hex()
+        root = ["ROOT", bytes(self.root)]
+        shift = self._shift
+        entries = [None] * self._branch_count
+        owners = [-1] * self._branch_count
+
+        for index in range(start, end):
+            for branch_index in range(self._branch_count):
+                node = index >> shift * branch_index
+                if owners[branch_index] == node:
+                    break
+                owners[branch_index] = node
+                entries[branch_index] = self._proof_entry(node, branch_index)
+
+            yield [header] + entries + [root]
+
     def marshal(self):
         return {
             "hash_type": self._hash_type,
@@ -206,6 +727,7 @@ class MerkleTree:
             "branches": {k: b"".join([v for v in leaves]).hex() for k, leaves in self.branches.items()},
             "leaf_count": self._leaf_count,
             "branch_count": self._branch_count,
+            "arity": self._arity,
         }
 
     @staticmethod
@@ -214,12 +736,53 @@ class MerkleTree:
         leaves = bytes.fromhex(leaves)
         return [leaves[i:i + hash_len] for i in range(0, len(leaves), hash_len)]
 
+    def __reduce_ex__(self, protocol):
+        # Each level travels as one contiguous buffer rather than a pickled
+        # object per node. Under protocol 5 the buffers can be handed over out
+        # of band, e.g. into shared memory, without being copied into the pickle.
+        levels = {k: b"".join(nodes) for k, nodes in self.branches.items()}
+        if protocol >= 5 and PickleBuffer is not None:
+            levels = {k: PickleBuffer(level) for k, level in levels.items()}
+
+        return type(self)._from_buffers, (
+            self._hash_type,
+            bytes(self.root),
+            levels,
+            self._leaf_count,
+            self._branch_count,
+            self._config(),
+        )
+
+    def _config(self):
+        # Constructor options that travel with a pickled tree.
+        return {
+            "arity": self._arity,
+            "indexed": self._index is not None,
+        }
+
+    @classmethod
+    def _from_buffers(cls, hash_type, root, levels, leaf_count, branch_count, config):
+        # iter_unpack splits a level in C, about twice as fast as slicing.
+        node = struct.Struct("{}s".format(util.get_hash_len(hash_type)))
+        branches = {k: [value for value, in node.iter_unpack(level)] for k, level in levels.items()}
+
+        return cls(
+            hash_type=hash_type,
+            root=bytearray(root),
+            branches=branches,
+            leaf_count=leaf_count,
+            branch_count=branch_count,
+            **config,
+        )
+
     @classmethod
-    def unmarshal(cls, payload):
+    def unmarshal(cls, payload, indexed=False):
         return cls(
             hash_type=payload["hash_type"],
             root=bytes.fromhex(payload["root"]),
             branches={k: cls._unpack_leaves(leaves, payload["hash_type"]) for k, leaves in payload["branches"].items()},
             leaf_count=payload["leaf_count"],
             branch_count=payload["branch_count"],
+            indexed=indexed,
+            arity=payload.get("arity", 2),
         )
@@ -37,8 +37,11 @@ def verify_proof(proof, leaf):
     for i in range(len(proof) - 1):
         if proof[i][0] == "R":
             leaf = combine(leaf, proof[i][1], hashfn)
-        else:
+        elif proof[i][0] == "L":
             leaf = combine(proof[i][1], leaf, hashfn)
+        else:
+            position, siblings = proof[i]
+            leaf = hash(b"".join(siblings[:position] + [leaf] + siblings[position:]), hashfn)
 
     return leaf == proof[-1][1]
 
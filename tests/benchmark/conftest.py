@@ -0,0 +1,89 @@
+import tracemalloc
+
+import pytest
+
+from mutable_merkle import util
+from mutable_merkle.tree import MerkleTree
+
+
+LEAF_COUNTS = [1, 32, 1024, 32768, 65536, 1048576, 10000000]
+
+
+def pytest_generate_tests(metafunc):
+    # Only the tree benchmarks take their sizes from --max-leaves, other
+    # modules parametrize count themselves.
+    if "count" in metafunc.fixturenames and metafunc.module.__name__.endswith(".test_tree"):
+        max_leaves = metafunc.config.getoption("--max-leaves")
+        metafunc.parametrize("count", [count for count in LEAF_COUNTS if count <= max_leaves])
+
+
+def pytest_collection_modifyitems(items):
+    # Run every tree benchmark for one hash and size before the next, so the
+    # single entry caches below build each list and tree once.
+    def key(item):
+        if not item.module.__name__.endswith(".test_tree"):
+            return (0,)
+        params = item.callspec.params if hasattr(item, "callspec") else {}
+        return (1, params.get("hash_type", ""), params.get("count", 0))
+
+    items.sort(key=key)
+
+
+@pytest.fixture(params=sorted(util.SUPPORTED_HASHES))
+def hash_type(request):
+    return request.param
+
+
+_leaves = {}
+_trees = {}
+
+
+@pytest.fixture
+def leaves(count, hash_type):
+    # Leaf hashes must match the tree's hash length.
+    key = (count, hash_type)
+    if key not in _leaves:
+        _leaves.clear()
+        hashfn = util.get_hashfn(hash_type)
+        _leaves[key] = [hashfn(i.to_bytes(8, "big")).digest() for i in range(count)]
+    return _leaves[key]
+
+
+@pytest.fixture
+def value(hash_type):
+    return util.get_hashfn(hash_type)(b"benchmark").digest()
+
+
+@pytest.fixture
+def tree(leaves, hash_type):
+    # Built once per size and hash, benchmarks that mutate work on a clone().
+    key = (len(leaves), hash_type)
+    if key not in _trees:
+        _trees.clear()
+        _trees[key] = MerkleTree.new(leaves, hash_type=hash_type, hashed=True)
+    return _trees[key]
+
+
+@pytest.fixture
+def peak_memory(benchmark):
+    def measure(fn, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            fn(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_bytes"] = peak
+
+    return measure
+
+
+@pytest.fixture
+def throughput(benchmark):
+    def record(items):
+        # There are no stats to read under --benchmark-disable.
+        if benchmark.disabled:
+            return
+        benchmark.extra_info["items_per_second"] = items / benchmark.stats.stats.mean
+
+    return record
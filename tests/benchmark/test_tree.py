@@ -1,10 +1,4 @@
-import random
-from hashlib import sha256
-from math import (
-    log,
-    log2,
-)
-from uuid import uuid4
+import pickle
 
 import pytest
 
@@ -12,210 +6,142 @@ from mutable_merkle import util
 from mutable_merkle.tree import MerkleTree
 
 
-BOOL = b"\x01"
-INT = b"\x02"
-UTF8 = b"\x03"
-BYTES = b"\x04"
-
-
-LEAF_COUNTS = [1, 2, 8, 32, 256, 1024, 32768, 65536]
-
-
-def digest_primitive(obj):
-    if isinstance(obj, bool):
-        return BOOL + (b"\x01" if obj else b"\x00")
-
-    elif isinstance(obj, int):
-        return INT + obj.to_bytes(8, "big", signed=True)
-
-    elif isinstance(obj, str):
-        return UTF8 + len(obj).to_bytes(4, "big") + obj.encode()
-
-    elif isinstance(obj, bytes):
-        return BYTES + len(obj).to_bytes(4, "big") + obj
-
-
-def digest(value):
-    return sha256(digest_primitive(value)).digest()
-
-
-# All of the commented tests fail, on purpose. They are very manual benchmarks
-# to give a clearer view of what is actually happening.
-#
-# import math
-# import time
-#
-# @pytest.fixture
-# def tree_factory(hash_type):
-#     def factory(count):
-#         m = MerkleTree.new([], hash_type=hash_type)
-#         for _ in range(count):
-#             m.add_leaf(digest(uuid4().hex), hashed=True)
-#
-#         return m
-#     return factory
-#
-#
-# @pytest.mark.parametrize("count", LEAF_COUNTS)
-# def test_merkle_add_N_hashed_leaves_xxx(count, hash_type, tree_factory):
-#     times = []
-#     for i in range(5):
-#         tree = tree_factory(count)
-#         value = digest(uuid4().hex)
-#         start = time.time()
-#         tree.add_leaf(value, hashed=True)
-#         times.append(time.time() - start)
-#     average = sum(times) / len(times)
-#     assert count == average
-#
-#
-# @pytest.mark.parametrize("count", LEAF_COUNTS)
-# def test_merkle_update_N_hashed_leaves_xxx(count, hash_type, tree_factory):
-#     times = []
-#     for i in range(5):
-#         tree = tree_factory(count)
-#         value = digest(uuid4().hex)
-#         start = time.time()
-#         tree.update_leaf(value, 0, hashed=True)
-#         times.append(time.time() - start)
-#     average = sum(times) / len(times)
-#     assert count == average
-#
-#
-# @pytest.mark.parametrize("count", LEAF_COUNTS)
-# def test_merkle_remove_N_hashed_leaves_xxx(count, hash_type, tree_factory):
-#     times = []
-#     for i in range(5):
-#         tree = tree_factory(count)
-#         value = digest(uuid4().hex)
-#         start = time.time()
-#         tree.update_leaf(value, math.floor(count / 2), hashed=True)
-#         times.append(time.time() - start)
-#     average = sum(times) / len(times)
-#     assert count == average
+def rounds_for(count):
+    # Large trees take seconds per call, keep their round count bounded.
+    if count >= 1048576:
+        return 3
+    if count >= 32768:
+        return 20
+    return 100
 
 
-@pytest.mark.parametrize("count", LEAF_COUNTS)
-def test_merkle_add_N_hashed_leaves(benchmark, count, hash_type):
-    def internal():
-        m = MerkleTree.new([], hash_type=hash_type)
-        for _ in range(count):
-            m.add_leaf(digest(uuid4().hex), hashed=True)
+def clone(tree):
+    return MerkleTree(
+        hash_type=tree._hash_type,
+        root=tree.root,
+        branches={k: list(v) for k, v in tree.branches.items()},
+        leaf_count=tree._leaf_count,
+        branch_count=tree._branch_count,
+    )
 
-    benchmark(internal)
 
+def positions(count):
+    return {
+        "head": 0,
+        "middle": count // 2,
+        "tail": count - 1,
+    }
 
-@pytest.mark.parametrize("count", LEAF_COUNTS)
-def test_merkle_add_N_unhashed_leaves(benchmark, count, hash_type):
-    def internal():
-        m = MerkleTree.new([], hash_type=hash_type)
-        for _ in range(count):
-            m.add_leaf(digest_primitive(uuid4().hex))
 
-    benchmark(internal)
+def test_build(benchmark, count, hash_type, leaves, peak_memory, throughput):
+    benchmark.pedantic(MerkleTree.new, args=(leaves, hash_type, True), rounds=rounds_for(count))
+    throughput(count)
+    peak_memory(MerkleTree.new, leaves, hash_type, True)
 
 
-@pytest.mark.parametrize("count", LEAF_COUNTS)
-def test_merkle_new_with_N_starting_leaves(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
+def test_build_unhashed(benchmark, count, hash_type, leaves, throughput):
+    benchmark.pedantic(MerkleTree.new, args=(leaves, hash_type), rounds=rounds_for(count))
+    throughput(count)
 
-    benchmark(MerkleTree.new, leaves=leaves, hash_type=hash_type)
 
+def test_new_many(benchmark, hash_type, throughput):
+    # Ingest sized trees, 8 to 64 leaves each.
+    leaf_lists = [[i.to_bytes(8, "big")] * (8 + i % 57) for i in range(1000)]
 
-@pytest.mark.parametrize("count", LEAF_COUNTS)
-def test_merkle_update_with_N_starting_leaves(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
+    benchmark.pedantic(MerkleTree.new_many, args=(leaf_lists, hash_type), rounds=20)
+    throughput(len(leaf_lists))
 
-    benchmark(m.update_leaf, digest(uuid4().hex), random.randint(0, count - 1))
 
+def test_roots_many(benchmark, hash_type, throughput):
+    leaf_lists = [[i.to_bytes(8, "big")] * (8 + i % 57) for i in range(1000)]
 
-@pytest.mark.parametrize("count", LEAF_COUNTS)
-def test_merkle_get(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
+    benchmark.pedantic(MerkleTree.roots_many, args=(leaf_lists, hash_type), rounds=20)
+    throughput(len(leaf_lists))
 
-    benchmark(m._get, random.randint(0, count - 1), 0)
 
+def test_append(benchmark, count, tree, value, peak_memory):
+    def setup():
+        return (clone(tree),), {}
 
-@pytest.mark.parametrize("count", LEAF_COUNTS)
-def test_merkle_get_sibling(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
+    def append(m):
+        m.add_leaf(value, hashed=True)
 
-    benchmark(m._get_sibling, random.randint(0, count - 1), 0)
+    benchmark.pedantic(append, setup=setup, rounds=rounds_for(count))
+    peak_memory(append, clone(tree))
 
 
-@pytest.mark.parametrize("count", LEAF_COUNTS)
-def test_merkle_update_byte_string(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
+@pytest.mark.parametrize("position", ["head", "middle", "tail"])
+def test_update(benchmark, count, tree, value, position):
+    offset = positions(count)[position]
+    # Updates rewrite the same leaf every round, a single clone keeps the
+    # shared tree intact for the proof benchmarks.
+    mt = clone(tree)
 
-    benchmark(m._update_byte_string, m.branches[0], digest(uuid4().hex), random.randint(0, count - 1))
+    benchmark(mt.update_leaf, value, offset, hashed=True)
 
 
-@pytest.mark.parametrize("count", LEAF_COUNTS)
-def test_merkle_update_branch(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
+@pytest.mark.parametrize("position", ["head", "middle", "tail"])
+def test_remove(benchmark, count, tree, position, peak_memory):
+    offset = positions(count)[position]
 
-    benchmark(m._update_branch, digest(uuid4().hex), random.randint(0, count - 1), 0)
+    def setup():
+        return (clone(tree),), {}
 
+    def remove(m):
+        m.remove_leaf(offset)
 
-@pytest.mark.parametrize("count", [2, 8, 32, 256, 1024, 32768, 65536])
-def test_merkle_update_parent(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
+    benchmark.pedantic(remove, setup=setup, rounds=rounds_for(count))
+    peak_memory(remove, clone(tree))
 
-    benchmark(m._update_parent, digest(uuid4().hex), random.randint(0, count - 1), 0, False)
 
+def test_get_proof(benchmark, count, tree):
+    benchmark(tree.get_proof, count // 2)
 
-@pytest.mark.parametrize("count", [2, 8, 32, 256, 1024, 32768, 65536])
-def test_merkle_update_parent_recurse(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
 
-    benchmark(m._update_parent, digest(uuid4().hex), random.randint(0, count - 1), 0, True)
+def test_iter_proofs(benchmark, count, tree, throughput):
+    def publish():
+        for _ in tree.iter_proofs():
+            pass
 
+    benchmark.pedantic(publish, rounds=rounds_for(count))
+    throughput(count)
 
-@pytest.mark.parametrize("count", [8, 32, 256, 1024, 32768, 65536])
-def test_merkle_rebuild_branch_early_key(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
 
-    benchmark(m._rebuild_branch, random.randint(0, count / 4), count, 0)
+def test_verify_proof(benchmark, count, tree, leaves):
+    proof = tree.get_proof(count // 2)
 
+    def setup():
+        # verify_proof consumes the hash type header.
+        return (list(proof), leaves[count // 2]), {}
 
-@pytest.mark.parametrize("count", [8, 32, 256, 1024, 32768, 65536])
-def test_merkle_rebuild_branch_mid_key(benchmark, count, hash_type):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves, hash_type=hash_type)
+    assert benchmark.pedantic(util.verify_proof, setup=setup, rounds=100)
 
-    benchmark(m._rebuild_branch, random.randint(count / 4, count / 2), count, 0)
 
+def test_marshal(benchmark, count, tree, peak_memory, throughput):
+    benchmark.pedantic(tree.marshal, rounds=rounds_for(count))
+    throughput(count)
+    peak_memory(tree.marshal)
 
-@pytest.mark.parametrize("count", [8, 32, 256, 1024, 32768, 65536])
-def test_merkle_rebuild_branch_late_key(benchmark, count):
-    leaves = [digest(uuid4().hex) for _ in range(count)]
-    m = MerkleTree.new(leaves=leaves)
 
-    benchmark(m._rebuild_branch, random.randint(3 * (count / 4), count - 1), count, 0)
+def test_unmarshal(benchmark, count, tree, peak_memory, throughput):
+    payload = tree.marshal()
 
+    benchmark.pedantic(MerkleTree.unmarshal, args=(payload,), rounds=rounds_for(count))
+    throughput(count)
+    peak_memory(MerkleTree.unmarshal, payload)
 
-def test_merkle_hash_siblings(benchmark):
-    benchmark(util.combine, digest(uuid4().hex), digest(uuid4().hex))
 
+def test_marshal_round_trip(benchmark, count, tree, throughput):
+    def round_trip():
+        return MerkleTree.unmarshal(tree.marshal())
 
-@pytest.mark.parametrize("count", [2, 8, 32, 256, 1024, 32768, 65536])
-def test_log(benchmark, count):
-    benchmark(log, count)
+    assert benchmark.pedantic(round_trip, rounds=rounds_for(count)) == tree
+    throughput(count)
 
 
-@pytest.mark.parametrize("count", [2, 8, 32, 256, 1024, 32768, 65536])
-def test_log2(benchmark, count):
-    benchmark(log2, count)
+def test_pickle_round_trip(benchmark, count, tree, throughput):
+    def round_trip():
+        return pickle.loads(pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL))
 
-
-@pytest.mark.parametrize("count", [2, 8, 32, 256, 1024, 32768, 65536])
-def test_log_bit_length(benchmark, count):
-    benchmark(count.bit_length)
+    assert benchmark.pedantic(round_trip, rounds=rounds_for(count)) == tree
+    throughput(count)
@@ -17,6 +17,13 @@ def pytest_addoption(parser):
         action="store",
         help="Run tests with the specified hash",
     )
+    parser.addoption(
+        "--max-leaves",
+        default=65536,
+        type=int,
+        action="store",
+        help="Largest tree size to benchmark",
+    )
 
 
 @pytest.fixture(autouse=True)
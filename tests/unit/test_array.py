@@ -0,0 +1,98 @@
+import pytest
+
+import mutable_merkle.tree
+import mutable_merkle.util
+
+
+np = pytest.importorskip("numpy")
+array = pytest.importorskip("mutable_merkle.array")
+
+
+@pytest.mark.parametrize("leaf_count", (1, 2, 3, 5, 8, 21, 54))
+def test_root_matches_tree(leaf_count, hash_type):
+    leaves = [str(i).encode() for i in range(leaf_count)]
+
+    m = mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type)
+    am = array.ArrayMerkleTree.new(leaves, hash_type=hash_type)
+
+    assert am.root == m.root
+    assert len(am) == leaf_count
+    assert am.marshal() == m.marshal()
+
+
+def test_mutations_match_tree(hash_type):
+    m = mutable_merkle.tree.MerkleTree(hash_type=hash_type)
+    am = array.ArrayMerkleTree(hash_type=hash_type)
+
+    operations = [("add_leaf", (str(i).encode(),)) for i in range(11)] + [
+        ("update_leaf", (b"z", 3)),
+        ("remove_leaf", (0,)),
+        ("remove_leaf", (9,)),
+        ("remove_leaf", (4,)),
+        ("add_leaf", (b"y",)),
+        ("remove_leaf", (2,)),
+        ("remove_leaf", (2,)),
+        ("remove_leaf", (2,)),
+        ("remove_leaf", (2,)),
+        ("remove_leaf", (2,)),
+        ("remove_leaf", (1,)),
+    ]
+    for name, args in operations:
+        getattr(m, name)(*args)
+        getattr(am, name)(*args)
+
+        assert am.root == m.root
+        assert am.get_proof(len(m) - 1) == m.get_proof(len(m) - 1)
+
+
+def test_remove_all_leaves(hash_type):
+    am = array.ArrayMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    for _ in range(3):
+        am.remove_leaf(0)
+
+    assert am == array.ArrayMerkleTree(hash_type=hash_type)
+    assert am.branches == {}
+
+
+def test_index_errors(hash_type):
+    am = array.ArrayMerkleTree(hash_type=hash_type)
+
+    with pytest.raises(IndexError):
+        am.remove_leaf(0)
+    with pytest.raises(IndexError):
+        am.update_leaf(b"a", 0)
+
+
+def test_proof_validates(hash_type, hashfn):
+    am = array.ArrayMerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type)
+
+    assert mutable_merkle.util.verify_proof(am.get_proof(4), hashfn(b"e").digest())
+
+
+def test_pairs_is_a_view(hash_type):
+    am = array.ArrayMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    pairs = am.pairs(0)
+
+    assert pairs.shape == (2, 2 * mutable_merkle.util.get_hash_len(hash_type))
+    assert np.shares_memory(pairs, am.branches[0])
+
+
+def test_empty_nodes_and_diff(hash_type):
+    am = array.ArrayMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+    am2 = array.ArrayMerkleTree.new([b"a", b"x", b"c", b"d", b"e"], hash_type=hash_type)
+
+    assert am.empty_nodes(0).tolist() == [False, False, False, True]
+    assert am.diff(am2).tolist() == [1, 3, 4]
+
+
+def test_marshal_interoperates_with_tree(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type)
+
+    am = array.ArrayMerkleTree.unmarshal(m.marshal())
+    am.add_leaf(b"f")
+    m.add_leaf(b"f")
+
+    assert am.root == m.root
+    assert mutable_merkle.tree.MerkleTree.unmarshal(am.marshal()) == m
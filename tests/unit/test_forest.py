@@ -0,0 +1,114 @@
+import pytest
+
+import mutable_merkle.forest
+import mutable_merkle.tree
+import mutable_merkle.util
+
+
+def test_root_is_tree_of_shard_roots(hash_type):
+    forest = mutable_merkle.forest.MerkleForest.new(
+        [[b"a", b"b"], [b"c"], [b"d", b"e", b"f"]],
+        hash_type=hash_type,
+    )
+
+    shard_roots = [mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type).root for leaves in [
+        [b"a", b"b"], [b"c"], [b"d", b"e", b"f"],
+    ]]
+    top = mutable_merkle.tree.MerkleTree.new(shard_roots, hashed=True, hash_type=hash_type)
+
+    assert forest.root == top.root
+    assert len(forest) == 6
+
+
+def test_empty_forest(hash_type):
+    forest = mutable_merkle.forest.MerkleForest(hash_type, 4)
+
+    assert len(forest) == 0
+    assert forest == mutable_merkle.forest.MerkleForest(hash_type, 4)
+
+
+def test_invalid_shard_count(hash_type):
+    with pytest.raises(ValueError):
+        mutable_merkle.forest.MerkleForest(hash_type, 0)
+
+
+def test_shard_count_must_match_shards(hash_type):
+    with pytest.raises(ValueError):
+        mutable_merkle.forest.MerkleForest(hash_type, 3, shards=[mutable_merkle.tree.MerkleTree(hash_type)])
+
+
+def test_mutations_match_rebuilt_forest(hash_type):
+    forest = mutable_merkle.forest.MerkleForest(hash_type, 2)
+
+    forest.add_leaf(0, b"a")
+    forest.add_leaf(0, b"b")
+    forest.add_leaf(1, b"c")
+    forest.add_leaf(1, b"x")
+    forest.update_leaf(1, b"d", 1)
+    forest.add_leaf(0, b"z")
+    forest.remove_leaf(0, 2)
+
+    expected = mutable_merkle.forest.MerkleForest.new([[b"a", b"b"], [b"c", b"d"]], hash_type=hash_type)
+
+    assert forest == expected
+
+
+def test_parallel_apply_matches_sequential(hash_type):
+    operations = []
+    for i in range(50):
+        operations.append(("add_leaf", i % 4, str(i).encode()))
+    operations.append(("remove_leaf", 2, 0))
+    operations.append(("update_leaf", 3, b"z", 5))
+
+    parallel = mutable_merkle.forest.MerkleForest(hash_type, 4)
+    parallel.apply(operations, max_workers=4)
+
+    sequential = mutable_merkle.forest.MerkleForest(hash_type, 4)
+    for name, shard, *args in operations:
+        getattr(sequential, name)(shard, *args)
+
+    assert parallel == sequential
+
+
+def test_apply_rejects_unknown_operation(hash_type):
+    forest = mutable_merkle.forest.MerkleForest(hash_type, 2)
+
+    with pytest.raises(ValueError):
+        forest.apply([("get_proof", 0, 0)])
+
+
+def test_apply_failing_partway_keeps_top_tree_in_step(hash_type, hashfn):
+    forest = mutable_merkle.forest.MerkleForest(hash_type, 2)
+
+    with pytest.raises(IndexError):
+        forest.apply([("add_leaf", 0, b"a"), ("remove_leaf", 0, 5)])
+
+    assert forest.root == mutable_merkle.forest.MerkleForest.new([[b"a"], []], hash_type=hash_type).root
+    assert mutable_merkle.util.verify_proof(forest.get_proof(0, 0), hashfn(b"a").digest())
+
+
+def test_combined_proof_validates(hash_type, hashfn):
+    forest = mutable_merkle.forest.MerkleForest.new(
+        [[b"a", b"b", b"c"], [b"d", b"e", b"f"], [b"g"]],
+        hash_type=hash_type,
+    )
+
+    proof = forest.get_proof(1, 1)
+
+    assert proof[-1] == ["ROOT", bytes(forest.root)]
+    assert mutable_merkle.util.verify_proof(proof, hashfn(b"e").digest())
+
+
+def test_shard_for_is_stable(hash_type):
+    forest = mutable_merkle.forest.MerkleForest(hash_type, 8)
+
+    shard = forest.shard_for(b"a")
+
+    assert 0 <= shard < 8
+    assert forest.shard_for(b"a") == shard
+
+
+def test_marshal_forest(hash_type):
+    forest = mutable_merkle.forest.MerkleForest.new([[b"a", b"b"], [b"c"]], hash_type=hash_type)
+
+    assert mutable_merkle.forest.MerkleForest.unmarshal(forest.marshal()) == forest
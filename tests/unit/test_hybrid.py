@@ -0,0 +1,132 @@
+import pickle
+
+import pytest
+
+import mutable_merkle.hybrid
+import mutable_merkle.tree
+import mutable_merkle.util
+
+
+VALUES = [str(i).encode() for i in range(37)]
+
+
+def test_subtree_height_must_be_positive(hash_type):
+    with pytest.raises(ValueError):
+        mutable_merkle.hybrid.HybridMerkleTree(hash_type=hash_type, subtree_height=0)
+
+
+@pytest.mark.parametrize("subtree_height", (1, 2, 3, 8))
+@pytest.mark.parametrize("leaf_count", (0, 1, 2, 5, 16, 37))
+def test_new_matches_tree(subtree_height, leaf_count, hash_type):
+    m = mutable_merkle.tree.MerkleTree.new(VALUES[:leaf_count], hash_type=hash_type)
+    hm = mutable_merkle.hybrid.HybridMerkleTree.new(
+        VALUES[:leaf_count],
+        hash_type=hash_type,
+        subtree_height=subtree_height,
+    )
+
+    assert hm.root == m.root
+    assert sorted(hm.branches) == [k for k in sorted(m.branches) if k == 0 or k >= subtree_height]
+    for k, nodes in hm.branches.items():
+        assert nodes == m.branches[k]
+
+
+@pytest.mark.parametrize("arity", (2, 4))
+def test_mutations_match_tree(arity, hash_type):
+    m = mutable_merkle.tree.MerkleTree.new(VALUES[:10], hash_type=hash_type, arity=arity)
+    hm = mutable_merkle.hybrid.HybridMerkleTree.new(VALUES[:10], hash_type=hash_type, arity=arity, subtree_height=2)
+
+    for mt in (m, hm):
+        for value in VALUES[10:30]:
+            mt.add_leaf(value)
+        mt.update_leaf(b"z", 17)
+        mt.remove_leaf(3)
+        mt.remove_leaves([0, 12, 20])
+        mt.extend(VALUES[30:])
+        mt.truncate(25)
+
+    assert hm.root == m.root
+    for k, nodes in hm.branches.items():
+        assert nodes == m.branches[k]
+
+
+def test_proofs_match_tree(hash_type, hashfn):
+    m = mutable_merkle.tree.MerkleTree.new(VALUES, hash_type=hash_type)
+    hm = mutable_merkle.hybrid.HybridMerkleTree.new(VALUES, hash_type=hash_type, subtree_height=3)
+
+    assert list(hm.iter_proofs()) == list(m.iter_proofs())
+    assert hm.get_proof(20) == m.get_proof(20)
+    assert mutable_merkle.util.verify_proof(hm.get_proof(20), hashfn(VALUES[20]).digest())
+
+
+def test_marshal_round_trip(hash_type):
+    hm = mutable_merkle.hybrid.HybridMerkleTree.new(VALUES, hash_type=hash_type, subtree_height=3)
+
+    payload = hm.marshal()
+    restored = mutable_merkle.hybrid.HybridMerkleTree.unmarshal(payload)
+
+    assert payload["subtree_height"] == 3
+    assert restored._height == 3
+    assert restored.branches == hm.branches
+    restored.update_leaf(b"z", 5)
+    hm.update_leaf(b"z", 5)
+    assert restored.root == hm.root
+
+
+def test_pickle_round_trip(hash_type):
+    hm = mutable_merkle.hybrid.HybridMerkleTree.new(VALUES, hash_type=hash_type, subtree_height=3)
+
+    restored = pickle.loads(pickle.dumps(hm, protocol=pickle.HIGHEST_PROTOCOL))
+
+    assert restored._height == 3
+    assert restored.branches == hm.branches
+    assert restored.get_proof(9) == hm.get_proof(9)
+
+
+@pytest.mark.parametrize("subtree_height", (1, 2, 3))
+@pytest.mark.parametrize("size", (4, 8, 16))
+def test_graft_matches_tree(size, subtree_height, hash_type):
+    m = mutable_merkle.tree.MerkleTree.new(VALUES[:10], hash_type=hash_type)
+    hm = mutable_merkle.hybrid.HybridMerkleTree.new(VALUES[:10], hash_type=hash_type, subtree_height=subtree_height)
+
+    for offset in range(0, len(VALUES), size):
+        subtree = mutable_merkle.tree.MerkleTree.new(VALUES[offset:offset + size], hash_type=hash_type)
+        m.graft(subtree, offset)
+        hm.graft(subtree, offset)
+
+        assert hm.root == m.root
+        for k, nodes in hm.branches.items():
+            assert nodes == m.branches[k]
+
+    assert hm.get_proof(20) == m.get_proof(20)
+
+
+@pytest.mark.parametrize("subtree_height", (1, 2, 3))
+@pytest.mark.parametrize("size", (4, 8, 16))
+def test_extract_subtree_matches_tree(size, subtree_height, hash_type):
+    hm = mutable_merkle.hybrid.HybridMerkleTree.new(VALUES, hash_type=hash_type, subtree_height=subtree_height)
+
+    for offset in range(0, len(VALUES), size):
+        subtree = hm.extract_subtree(offset, size)
+        expected = mutable_merkle.tree.MerkleTree.new(VALUES[offset:offset + size], hash_type=hash_type)
+
+        assert subtree._height == subtree_height
+        assert subtree.root == expected.root
+        assert len(subtree) == len(expected)
+        for k, nodes in subtree.branches.items():
+            assert nodes == expected.branches[k]
+
+
+# Inside the tree, appended past its end and replacing the whole tree.
+@pytest.mark.parametrize("offset,size", ((0, 8), (8, 8), (0, 16)))
+def test_graft_hybrid_subtree_into_tree(offset, size, hash_type):
+    hm = mutable_merkle.hybrid.HybridMerkleTree.new(VALUES, hash_type=hash_type, subtree_height=2)
+    m = mutable_merkle.tree.MerkleTree.new(VALUES[:10], hash_type=hash_type)
+    expected = mutable_merkle.tree.MerkleTree.new(VALUES[:10], hash_type=hash_type)
+
+    m.graft(hm.extract_subtree(offset, size), offset)
+    expected.graft(mutable_merkle.tree.MerkleTree.new(VALUES[offset:offset + size], hash_type=hash_type), offset)
+
+    assert m.root == expected.root
+    assert m.branches == expected.branches
+    assert m.get_proof(len(m) - 1) == expected.get_proof(len(m) - 1)
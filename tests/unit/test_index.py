@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+import mutable_merkle.index
+import mutable_merkle.tree
+import mutable_merkle.util
+
+
+def test_index_of(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type, indexed=True)
+
+    assert m.index_of(b"c") == 2
+    with pytest.raises(ValueError):
+        m.index_of(b"z")
+
+
+def test_index_of_without_index_scans(hash_type, hashfn):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"a"], hash_type=hash_type)
+
+    assert m.index_of(b"b") == 1
+    assert m.index_of(hashfn(b"b").digest(), hashed=True) == 1
+    assert m.indices_of(b"a") == [0, 2]
+    with pytest.raises(ValueError):
+        m.index_of(b"z")
+
+
+def test_index_tracks_mutations(hash_type):
+    m = mutable_merkle.tree.MerkleTree(hash_type=hash_type, indexed=True)
+    for value in [b"a", b"b", b"c", b"d", b"e"]:
+        m.add_leaf(value)
+
+    m.remove_leaf(1)
+    m.update_leaf(b"z", 0)
+
+    assert m.index_of(b"c") == 1
+    assert m.index_of(b"e") == 3
+    assert m.index_of(b"z") == 0
+    with pytest.raises(ValueError):
+        m.index_of(b"a")
+    with pytest.raises(ValueError):
+        m.index_of(b"b")
+
+
+def test_duplicates(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"a", b"c", b"a"], hash_type=hash_type, indexed=True)
+
+    m.remove_leaf(0)
+    m.update_leaf(b"a", 2)
+
+    assert m.index_of(b"a") == 1
+    assert m.indices_of(b"a") == [1, 2, 3]
+    assert m.indices_of(b"z") == []
+
+
+def test_get_proof_for(hash_type, hashfn):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type, indexed=True)
+
+    proof = m.get_proof_for(b"d")
+
+    assert proof == m.get_proof(3)
+    assert mutable_merkle.util.verify_proof(proof, hashfn(b"d").digest())
+
+
+def test_unmarshal_indexed(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    m2 = mutable_merkle.tree.MerkleTree.unmarshal(m.marshal(), indexed=True)
+
+    assert m2.index_of(b"b") == 1
+
+
+def test_index_matches_scan_under_random_operations(hash_type, hashfn):
+    rng = random.Random(7)
+    m = mutable_merkle.tree.MerkleTree(hash_type=hash_type, indexed=True)
+    values = [str(i).encode() for i in range(20)]
+
+    for _ in range(3000):
+        choice = rng.random()
+        if choice < 0.45 or not len(m):
+            m.add_leaf(rng.choice(values))
+        elif choice < 0.7:
+            m.update_leaf(rng.choice(values), rng.randrange(len(m)))
+        else:
+            m.remove_leaf(rng.randrange(len(m)))
+
+    leaves = m.branches[0][:len(m)] if len(m) else []
+    for value in values:
+        leaf = hashfn(value).digest()
+        assert m.indices_of(value) == [i for i, v in enumerate(leaves) if v == leaf]
+
+
+def test_leaf_index_compacts_after_many_removals():
+    index = mutable_merkle.index.LeafIndex([b"a"] * 3000)
+
+    for _ in range(2000):
+        index.remove(0, b"a")
+
+    assert index.fragmented
+    assert len(index) == 1000
+    assert index.indices_of(b"a") == list(range(1000))
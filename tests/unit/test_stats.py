@@ -0,0 +1,125 @@
+import os
+import threading
+
+import mutable_merkle.sync
+import mutable_merkle.tree
+
+
+def test_instrumented_tree_matches_plain_tree(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+    m2 = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+    m2.instrument()
+
+    for tree in (m, m2):
+        tree.add_leaf(b"d")
+        tree.update_leaf(b"z", 1)
+        tree.remove_leaf(0)
+
+    assert m == m2
+    assert m.get_proof(1) == m2.get_proof(1)
+
+
+def test_counts_hash_calls_per_operation(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e", b"f", b"g"], hash_type=hash_type)
+    stats = m.instrument()
+
+    m.update_leaf(b"z", 2)
+    m.update_leaf(b"y", 3, hashed=False)
+    m.get_proof(0)
+
+    # One leaf hash plus one internal node per level (root included).
+    assert stats["update_leaf"].calls == 2
+    assert stats["update_leaf"].nodes_hashed == 2 * 3
+    assert stats["update_leaf"].hash_calls == 2 * 4
+    assert stats["get_proof"].hash_calls == 0
+    assert stats["update_leaf"].elapsed > 0
+
+
+def test_remove_near_head_reports_rebuild(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([str(i).encode() for i in range(64)], hash_type=hash_type)
+    stats = m.instrument()
+
+    m.remove_leaf(63)
+    tail = stats["remove_leaf"].nodes_hashed
+    m.remove_leaf(0)
+    head = stats["remove_leaf"].nodes_hashed - tail
+
+    assert head > 10 * tail
+
+
+def test_hooks_receive_records(hash_type):
+    records = []
+    m = mutable_merkle.tree.MerkleTree(hash_type=hash_type)
+    m.instrument(hooks=[records.append])
+
+    m.add_leaf(b"a")
+    m.add_leaf(b"b")
+
+    assert [r.name for r in records] == ["add_leaf", "add_leaf"]
+    assert records[1].nodes_hashed == 1
+
+
+def test_concurrent_readers_are_each_recorded(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+    inside = threading.Barrier(2, timeout=5)
+    index_of = cm.index_of
+
+    def waiting_index_of(value):
+        # Both threads hash their value while both are inside the
+        # instrumented call.
+        inside.wait()
+        offset = index_of(value)
+        inside.wait()
+        return offset
+
+    cm.index_of = waiting_index_of
+    stats = cm.instrument()
+
+    threads = [threading.Thread(target=cm.index_of, args=(value,)) for value in (b"a", b"b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not inside.broken
+    assert stats["index_of"].calls == 2
+    # One leaf hash each, not the other thread's as well.
+    assert stats["index_of"].hash_calls == 2
+
+
+def test_level_bytes(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type)
+    stats = m.instrument()
+
+    level_bytes = stats.level_bytes()
+
+    assert sorted(level_bytes) == [0, 1, 2]
+    assert level_bytes[0] > level_bytes[1] > level_bytes[2] > 0
+
+
+def test_uninstrument_restores_class_methods(hash_type):
+    m = mutable_merkle.tree.MerkleTree(hash_type=hash_type)
+    hashfn = m._hashfn
+    stats = m.instrument()
+
+    m.uninstrument()
+    m.add_leaf(b"a")
+
+    assert "add_leaf" not in vars(m)
+    assert m._hashfn is hashfn
+    assert stats.operations == {}
+
+
+def test_refresh_counts_chunk_hashes(tmpdir, hash_type):
+    path = str(tmpdir.join("blob"))
+    with open(path, "wb") as f:
+        f.write(os.urandom(1000))
+    mt = mutable_merkle.tree.MerkleTree.from_file(path, chunk_size=100, hash_type=hash_type)
+    stats = mt.instrument()
+
+    with open(path, "ab") as f:
+        f.write(os.urandom(100))
+    mt.refresh(path, workers=2)
+
+    # Every chunk is rehashed, on the worker threads.
+    assert stats["refresh"].hash_calls - stats["refresh"].nodes_hashed == 11
@@ -0,0 +1,114 @@
+import pickle
+
+import pytest
+
+import mutable_merkle.store
+import mutable_merkle.tree
+
+
+VALUES = [str(i).encode() for i in range(37)]
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join("tree.db"))
+
+
+def test_new_matches_tree(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new(VALUES, hash_type=hash_type)
+    sm = mutable_merkle.store.SQLiteMerkleTree.new(VALUES, hash_type=hash_type)
+
+    assert sm.root == m.root
+    assert sm.get_proof(11) == m.get_proof(11)
+
+
+def test_open_empty(path, hash_type):
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path, hash_type=hash_type, arity=4)
+
+    assert len(sm) == 0
+    assert sm._hash_type == hash_type
+    assert sm._arity == 4
+
+
+def test_commit_and_reopen(path, hash_type):
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path, hash_type=hash_type, arity=4)
+    sm.extend(VALUES)
+    sm.commit()
+    sm.close()
+
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path)
+    m = mutable_merkle.tree.MerkleTree.new(VALUES, hash_type=hash_type, arity=4)
+
+    assert sm._hash_type == hash_type
+    assert sm._arity == 4
+    assert len(sm) == len(VALUES)
+    assert sm.root == m.root
+    assert sm.get_proof(20) == m.get_proof(20)
+
+
+def test_mutations_persist(path, hash_type):
+    m = mutable_merkle.tree.MerkleTree.new(VALUES, hash_type=hash_type)
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path, hash_type=hash_type)
+    sm.extend(VALUES)
+    sm.commit()
+
+    for mt in (m, sm):
+        mt.update_leaf(b"z", 4)
+        mt.remove_leaf(0)
+        mt.remove_leaves([3, 9])
+        mt.add_leaf(b"y")
+        mt.truncate(20)
+    sm.commit()
+    sm.close()
+
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path)
+    rows = dict(sm._connection.execute("SELECT level, count(*) FROM nodes GROUP BY level"))
+
+    assert sm.root == m.root
+    assert {k: list(nodes) for k, nodes in sm.branches.items()} == m.branches
+    assert rows == {k: len(nodes) for k, nodes in m.branches.items()}
+
+
+def test_close_discards_uncommitted_changes(path, hash_type):
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path, hash_type=hash_type)
+    sm.extend(VALUES)
+    sm.commit()
+    root = sm.root
+
+    sm.update_leaf(b"z", 0)
+    sm.close()
+
+    assert mutable_merkle.store.SQLiteMerkleTree.open(path).root == root
+
+
+def test_open_loads_nodes_lazily(path, hash_type):
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path, hash_type=hash_type)
+    sm.extend(VALUES)
+    sm.commit()
+    sm.close()
+
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path)
+    assert all(not nodes._cache for nodes in sm.branches.values())
+
+    sm.update_leaf(b"z", 5)
+
+    assert len(sm.branches[0]._cache) == 2
+    assert all(len(nodes._dirty) <= 1 for nodes in sm.branches.values())
+
+
+def test_open_indexed(path, hash_type):
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path, hash_type=hash_type)
+    sm.extend(VALUES)
+    sm.commit()
+    sm.close()
+
+    sm = mutable_merkle.store.SQLiteMerkleTree.open(path, indexed=True)
+
+    assert sm.index_of(b"12") == 12
+
+
+def test_pickle_is_rejected(hash_type):
+    sm = mutable_merkle.store.SQLiteMerkleTree.new(VALUES, hash_type=hash_type)
+
+    with pytest.raises(TypeError):
+        pickle.dumps(sm)
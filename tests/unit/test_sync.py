@@ -0,0 +1,158 @@
+import pickle
+import threading
+
+import pytest
+
+import mutable_merkle.sync
+import mutable_merkle.tree
+import mutable_merkle.util
+
+
+def test_concurrent_tree_matches_tree(hash_type):
+    leaves = [b"a", b"b", b"c", b"d", b"e"]
+    m = mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type)
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new(leaves, hash_type=hash_type)
+
+    assert cm.root == m.root
+    assert len(cm) == len(m)
+    assert cm.get_proof(3) == m.get_proof(3)
+
+    m.remove_leaf(1)
+    cm.remove_leaf(1)
+    m.update_leaf(b"z", 0)
+    cm.update_leaf(b"z", 0)
+
+    assert cm.root == m.root
+
+
+def test_marshal_round_trip(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    assert mutable_merkle.sync.ConcurrentMerkleTree.unmarshal(cm.marshal()) == cm
+
+
+def test_pickle_round_trip(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    restored = pickle.loads(pickle.dumps(cm, protocol=pickle.HIGHEST_PROTOCOL))
+    restored.add_leaf(b"d")
+
+    assert type(restored) is mutable_merkle.sync.ConcurrentMerkleTree
+    assert restored.root == mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d"], hash_type=hash_type).root
+
+
+def test_iter_proofs_holds_read_lock(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    proofs = cm.iter_proofs()
+    first = next(proofs)
+
+    with pytest.raises(RuntimeError):
+        cm.add_leaf(b"d")
+
+    assert [first] + list(proofs) == [cm.get_proof(i) for i in range(3)]
+    cm.add_leaf(b"d")
+
+
+def test_iter_proofs_closed_on_another_thread_releases_read_lock(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    proofs = cm.iter_proofs()
+    next(proofs)
+
+    closer = threading.Thread(target=proofs.close)
+    closer.start()
+    closer.join()
+
+    writer = threading.Thread(target=cm.add_leaf, args=(b"d",), daemon=True)
+    writer.start()
+    writer.join(timeout=5)
+
+    assert not writer.is_alive()
+    assert len(cm) == 4
+    # The closing thread released the read, this thread holds nothing.
+    cm.add_leaf(b"e")
+
+
+def test_iter_proofs_started_in_write_block_holds_read_lock(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    with cm.write():
+        proofs = cm.iter_proofs()
+        next(proofs)
+
+    writer = threading.Thread(target=cm.add_leaf, args=(b"d",), daemon=True)
+    writer.start()
+    writer.join(timeout=0.2)
+
+    assert writer.is_alive()
+    assert len(list(proofs)) == 2
+
+    writer.join(timeout=5)
+    assert not writer.is_alive()
+    assert len(cm) == 4
+
+
+def test_write_block_is_reentrant(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree(hash_type=hash_type)
+
+    with cm.write():
+        cm.add_leaf(b"a")
+        cm.add_leaf(b"b")
+        proof = cm.get_proof(0)
+
+    assert proof[-1] == ["ROOT", bytes(cm.root)]
+
+
+def test_read_cannot_upgrade_to_write(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"a"], hash_type=hash_type)
+
+    with cm.read():
+        with pytest.raises(RuntimeError):
+            cm.add_leaf(b"b")
+
+
+def test_readers_do_not_block_each_other(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"a", b"b"], hash_type=hash_type)
+    inside = threading.Barrier(2, timeout=5)
+
+    def reader():
+        with cm.read():
+            # Both threads must hold the read lock at once to pass the barrier.
+            inside.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not inside.broken
+
+
+def test_proofs_are_pinned_to_a_published_root(hash_type):
+    cm = mutable_merkle.sync.ConcurrentMerkleTree.new([b"0"], hash_type=hash_type)
+    errors = []
+    done = threading.Event()
+
+    def writer():
+        for i in range(1, 200):
+            cm.add_leaf(str(i).encode())
+            cm.update_leaf(str(i).encode(), 0)
+        done.set()
+
+    def reader():
+        while not done.is_set():
+            with cm.read():
+                proof = cm.get_proof(0)
+                leaf = bytes(cm.branches[0][0])
+            if not mutable_merkle.util.verify_proof(proof, leaf):
+                errors.append(proof)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
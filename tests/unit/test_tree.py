@@ -1,3 +1,7 @@
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
 import mutable_merkle.tree
@@ -439,3 +443,529 @@ def test_combined_proofs_validates(hash_type, hashfn):
     combined_proof = mutable_merkle.util.combine_proofs(proof_of_e, proof_of_m2)
 
     assert mutable_merkle.util.verify_proof(combined_proof, hashfn(b"e").digest())
+
+
+def test_add_after_removing_tail_of_two_leaves(hash_type):
+    m1 = mutable_merkle.tree.MerkleTree.new([b"a", b"c"], hash_type=hash_type)
+    m2 = mutable_merkle.tree.MerkleTree.new([b"a", b"b"], hash_type=hash_type)
+
+    m2.remove_leaf(1)
+    m2.add_leaf(b"c")
+
+    assert m1._branch_count == m2._branch_count
+    assert m1.root == m2.root
+
+
+def test_rebuild_matches_new_after_mixed_operations(hash_type):
+    m1 = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type)
+
+    for value in [b"f", b"g", b"h", b"i"]:
+        m1.add_leaf(value)
+    m1.remove_leaf(0)
+    m1.update_leaf(b"z", 4)
+    m1.remove_leaf(7)
+    m1.remove_leaf(2)
+
+    m2 = mutable_merkle.tree.MerkleTree.new([b"b", b"c", b"e", b"z", b"g", b"h"], hash_type=hash_type)
+
+    assert m1.root == m2.root
+    assert m1.branches == m2.branches
+
+
+@pytest.mark.parametrize("offsets", (
+    [0],
+    [9],
+    [3, 5],
+    [5, 3, 3],
+    [0, 1, 2, 3, 4, 5, 6],
+    [1, 2, 3, 4, 5, 6, 7, 8, 9],
+    [2, 9, 4, 7],
+))
+def test_remove_leaves_matches_single_removals(offsets, hash_type):
+    leaves = [b"a", b"b", b"c", b"d", b"e", b"f", b"g", b"h", b"i", b"j"]
+    m1 = mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type)
+    m2 = mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type)
+
+    m1.remove_leaves(offsets)
+    for offset in sorted(set(offsets), reverse=True):
+        m2.remove_leaf(offset)
+
+    expected = mutable_merkle.tree.MerkleTree.new(
+        [leaf for i, leaf in enumerate(leaves) if i not in offsets],
+        hash_type=hash_type,
+    )
+
+    assert m1.root == m2.root == expected.root
+    assert m1.branches == expected.branches
+    assert len(m1) == len(expected)
+
+
+def test_remove_leaves_all(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    m.remove_leaves([0, 1, 2])
+
+    assert m == mutable_merkle.tree.MerkleTree(hash_type=hash_type)
+    assert len(m) == 0
+    assert m.branches == {}
+
+
+def test_remove_leaves_out_of_range(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    with pytest.raises(IndexError):
+        m.remove_leaves([1, 3])
+    with pytest.raises(IndexError):
+        mutable_merkle.tree.MerkleTree(hash_type=hash_type).remove_leaves([0])
+
+    assert len(m) == 3
+
+
+def test_remove_leaves_updates_index(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type, indexed=True)
+
+    m.remove_leaves([0, 2])
+
+    assert m.index_of(b"b") == 0
+    assert m.index_of(b"e") == 2
+
+
+@pytest.mark.parametrize("size", (0, 1, 2, 3, 4, 5, 8, 9, 10, 12))
+def test_truncate(size, hash_type):
+    leaves = [b"a", b"b", b"c", b"d", b"e", b"f", b"g", b"h", b"i", b"j"]
+    m = mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type)
+
+    m.truncate(size)
+
+    expected = mutable_merkle.tree.MerkleTree.new(leaves[:size], hash_type=hash_type)
+    assert m.root == expected.root
+    assert m.branches == expected.branches
+    assert len(m) == min(size, len(leaves))
+
+
+def test_truncate_negative(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a"], hash_type=hash_type)
+
+    with pytest.raises(ValueError):
+        m.truncate(-1)
+
+
+@pytest.mark.parametrize("start,count", (
+    (0, 0), (0, 1), (0, 5), (1, 1), (1, 3), (2, 2), (3, 6), (4, 1), (5, 12),
+))
+def test_extend(start, count, hash_type):
+    leaves = [str(i).encode() for i in range(start + count)]
+    m = mutable_merkle.tree.MerkleTree.new(leaves[:start], hash_type=hash_type)
+
+    m.extend(leaves[start:])
+
+    expected = mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type)
+    assert m.root == expected.root
+    assert m.branches == expected.branches
+    assert len(m) == len(leaves)
+
+
+def test_extend_hashed(hash_type, hashfn):
+    m = mutable_merkle.tree.MerkleTree.new([b"a"], hash_type=hash_type)
+
+    m.extend(iter([hashfn(b"b").digest(), hashfn(b"c").digest()]), hashed=True)
+
+    assert m == mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+
+def test_truncate_and_extend_update_index(hash_type):
+    m = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d"], hash_type=hash_type, indexed=True)
+
+    m.truncate(2)
+    m.extend([b"d", b"e"])
+
+    assert m.indices_of(b"c") == []
+    assert m.index_of(b"d") == 2
+    assert m.index_of(b"e") == 3
+
+
+@pytest.mark.parametrize("arity", (0, 1, 3, 6))
+def test_arity_must_be_power_of_two(arity, hash_type):
+    with pytest.raises(ValueError):
+        mutable_merkle.tree.MerkleTree(hash_type=hash_type, arity=arity)
+
+
+def test_quaternary_root(hash_type, hashfn):
+    mt = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type, arity=4)
+
+    empty = bytes(len(mt.root))
+    left = hashfn(b"".join(hashfn(v).digest() for v in [b"a", b"b", b"c", b"d"])).digest()
+    right = hashfn(hashfn(b"e").digest() + empty * 3).digest()
+
+    assert mt._branch_count == 2
+    assert mt.root == hashfn(left + right + empty * 2).digest()
+
+
+@pytest.mark.parametrize("arity", (4, 8, 16))
+def test_arity_rebuild_matches_new_after_mixed_operations(arity, hash_type):
+    values = [str(i).encode() for i in range(40)]
+    m1 = mutable_merkle.tree.MerkleTree.new(values[:20], hash_type=hash_type, arity=arity)
+
+    for value in values[20:]:
+        m1.add_leaf(value)
+    m1.update_leaf(b"z", 3)
+    m1.remove_leaf(0)
+    m1.remove_leaves([5, 17, 38])
+    m1.truncate(30)
+    m1.extend([b"x", b"y"])
+
+    expected = [v for i, v in enumerate(values) if i not in (0, 6, 18)][:30] + [b"x", b"y"]
+    expected[2] = b"z"
+    m2 = mutable_merkle.tree.MerkleTree.new(expected, hash_type=hash_type, arity=arity)
+
+    assert m1.root == m2.root
+    assert m1.branches == m2.branches
+
+
+@pytest.mark.parametrize("arity", (4, 8))
+def test_arity_proofs_validate(arity, hash_type, hashfn):
+    values = [str(i).encode() for i in range(21)]
+    mt = mutable_merkle.tree.MerkleTree.new(values, hash_type=hash_type, arity=arity)
+
+    for offset, value in enumerate(values):
+        proof = mt.get_proof(offset)
+        assert len(proof[1][1]) == arity - 1
+        assert mutable_merkle.util.verify_proof(proof, hashfn(value).digest()) is True
+
+    assert mutable_merkle.util.verify_proof(mt.get_proof(3), hashfn(b"z").digest()) is False
+
+
+def test_combined_proofs_of_mixed_arity_validate(hash_type, hashfn):
+    child = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type, arity=4)
+    parent = mutable_merkle.tree.MerkleTree.new([b"x", child.root, b"y"], hashed=True, hash_type=hash_type)
+
+    combined_proof = mutable_merkle.util.combine_proofs(child.get_proof(4), parent.get_proof(1))
+
+    assert mutable_merkle.util.verify_proof(combined_proof, hashfn(b"e").digest())
+
+
+def test_marshal_tree_arity(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c", b"d", b"e"], hash_type=hash_type, arity=8)
+
+    payload = mt.marshal()
+    m2 = mutable_merkle.tree.MerkleTree.unmarshal(payload)
+    m2.add_leaf(b"f")
+    mt.add_leaf(b"f")
+
+    assert payload["arity"] == 8
+    assert m2.root == mt.root
+    assert m2.branches == mt.branches
+
+
+def test_unmarshal_defaults_to_binary(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new([b"a", b"b", b"c"], hash_type=hash_type)
+
+    payload = mt.marshal()
+    del payload["arity"]
+
+    assert mutable_merkle.tree.MerkleTree.unmarshal(payload)._arity == 2
+
+
+@pytest.mark.parametrize("protocol", range(2, pickle.HIGHEST_PROTOCOL + 1))
+@pytest.mark.parametrize("leaf_count", (0, 1, 2, 5, 16))
+def test_pickle_round_trip(protocol, leaf_count, hash_type):
+    values = [str(i).encode() for i in range(leaf_count)]
+    mt = mutable_merkle.tree.MerkleTree.new(values, hash_type=hash_type, arity=4, indexed=True)
+
+    m2 = pickle.loads(pickle.dumps(mt, protocol=protocol))
+
+    assert m2 == mt
+    assert m2.branches == mt.branches
+    assert len(m2) == leaf_count
+    assert m2._arity == 4
+    assert m2._index is not None
+
+    m2.add_leaf(b"x")
+    mt.add_leaf(b"x")
+    assert m2.root == mt.root
+    assert m2.index_of(b"x") == leaf_count
+
+
+def test_pickle_levels_are_single_buffers(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new([str(i).encode() for i in range(100)], hash_type=hash_type)
+
+    _, (_, _, levels, _, _, _) = mt.__reduce_ex__(2)
+
+    assert sorted(levels) == list(range(mt._branch_count))
+    assert levels[0] == b"".join(mt.branches[0])
+
+
+@pytest.mark.skipif(mutable_merkle.tree.PickleBuffer is None, reason="requires pickle protocol 5")
+def test_pickle_out_of_band_buffers(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new([str(i).encode() for i in range(100)], hash_type=hash_type)
+
+    buffers = []
+    data = pickle.dumps(mt, protocol=5, buffer_callback=buffers.append)
+    m2 = pickle.loads(data, buffers=[bytearray(b.raw()) for b in buffers])
+
+    assert len(buffers) == mt._branch_count
+    assert len(data) < mt._hash_len * 10
+    assert m2.branches == mt.branches
+    assert m2.root == mt.root
+
+
+@pytest.mark.parametrize("arity", (2, 4))
+@pytest.mark.parametrize("leaf_count", (0, 1, 2, 3, 17))
+def test_iter_proofs_matches_get_proof(arity, leaf_count, hash_type):
+    values = [str(i).encode() for i in range(leaf_count)]
+    mt = mutable_merkle.tree.MerkleTree.new(values, hash_type=hash_type, arity=arity)
+
+    assert list(mt.iter_proofs()) == [mt.get_proof(i) for i in range(leaf_count)]
+
+
+def test_iter_proofs_range(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new([str(i).encode() for i in range(10)], hash_type=hash_type)
+
+    assert list(mt.iter_proofs(3, 7)) == [mt.get_proof(i) for i in range(3, 7)]
+    assert list(mt.iter_proofs(8, 100)) == [mt.get_proof(8), mt.get_proof(9)]
+    assert list(mt.iter_proofs(5, 5)) == []
+
+
+def test_iter_proofs_share_entries_and_validate(hash_type, hashfn):
+    values = [str(i).encode() for i in range(8)]
+    mt = mutable_merkle.tree.MerkleTree.new(values, hash_type=hash_type)
+
+    proofs = list(mt.iter_proofs())
+
+    assert proofs[0][2] is proofs[1][2]
+    assert proofs[0][3] is proofs[3][3]
+    for proof, value in zip(proofs, values):
+        assert mutable_merkle.util.verify_proof(proof, hashfn(value).digest())
+
+
+LEAF_LISTS = [[str(i).encode() for i in range(count)] for count in (0, 1, 2, 3, 8, 13, 64)]
+
+
+@pytest.mark.parametrize("arity", (2, 4))
+def test_new_many_matches_new(arity, hash_type):
+    trees = mutable_merkle.tree.MerkleTree.new_many(LEAF_LISTS, hash_type=hash_type, arity=arity)
+
+    for leaves, mt in zip(LEAF_LISTS, trees):
+        expected = mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type, arity=arity)
+        assert mt.root == expected.root
+        assert mt.branches == expected.branches
+        assert len(mt) == len(expected)
+
+        mt.add_leaf(b"x")
+        expected.add_leaf(b"x")
+        assert mt.root == expected.root
+
+
+def test_new_many_hashed(hash_type, hashfn):
+    leaf_lists = [[hashfn(leaf).digest() for leaf in leaves] for leaves in LEAF_LISTS]
+
+    trees = mutable_merkle.tree.MerkleTree.new_many(leaf_lists, hash_type=hash_type, hashed=True)
+
+    assert [mt.root for mt in trees] == [
+        mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type).root for leaves in LEAF_LISTS
+    ]
+
+
+def test_roots_many(hash_type):
+    roots = mutable_merkle.tree.MerkleTree.roots_many(LEAF_LISTS, hash_type=hash_type, arity=4)
+
+    assert roots == [
+        mutable_merkle.tree.MerkleTree.new(leaves, hash_type=hash_type, arity=4).root for leaves in LEAF_LISTS
+    ]
+
+
+def test_new_many_executor(hash_type):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        trees = mutable_merkle.tree.MerkleTree.new_many(
+            LEAF_LISTS,
+            hash_type=hash_type,
+            executor=executor,
+            chunk_size=2,
+        )
+        roots = mutable_merkle.tree.MerkleTree.roots_many(LEAF_LISTS, hash_type=hash_type, executor=executor)
+
+    assert [mt.root for mt in trees] == roots
+    assert [mt.branches for mt in trees] == [mt.branches for mt in mutable_merkle.tree.MerkleTree.new_many(
+        LEAF_LISTS,
+        hash_type=hash_type,
+    )]
+
+
+def write_file(path, data, mtime=None):
+    with open(path, "wb") as f:
+        f.write(data)
+    if mtime is not None:
+        # Filesystem timestamps can be too coarse to tell two writes apart.
+        os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.mark.parametrize("size", (0, 1, 99, 100, 101, 1000))
+def test_from_file_matches_chunks(size, tmpdir, hash_type):
+    path = str(tmpdir.join("blob"))
+    data = os.urandom(size)
+    write_file(path, data)
+
+    mt = mutable_merkle.tree.MerkleTree.from_file(path, chunk_size=100, hash_type=hash_type, workers=2)
+    chunks = [data[i:i + 100] for i in range(0, size, 100)]
+
+    assert mt == mutable_merkle.tree.MerkleTree.new(chunks, hash_type=hash_type)
+    assert len(mt) == len(chunks)
+
+
+def test_refresh_updates_changed_chunks(tmpdir, hash_type):
+    path = str(tmpdir.join("blob"))
+    data = bytearray(os.urandom(1000))
+    write_file(path, data, mtime=1)
+    mt = mutable_merkle.tree.MerkleTree.from_file(path, chunk_size=100, hash_type=hash_type)
+
+    data[250] ^= 1
+    data[999] ^= 1
+    write_file(path, data, mtime=2)
+
+    assert mt.refresh(path) == [2, 9]
+    assert mt == mutable_merkle.tree.MerkleTree.from_file(path, chunk_size=100, hash_type=hash_type)
+
+
+def test_refresh_skips_unchanged_file(tmpdir, hash_type):
+    path = str(tmpdir.join("blob"))
+    write_file(path, os.urandom(1000), mtime=1)
+    mt = mutable_merkle.tree.MerkleTree.from_file(path, chunk_size=100, hash_type=hash_type)
+    root = mt.root
+
+    # Same size and mtime, the content is not read.
+    write_file(path, os.urandom(1000), mtime=1)
+
+    assert mt.refresh(path) == []
+    assert mt.root == root
+
+
+@pytest.mark.parametrize("size", (0, 50, 450, 1000, 1550))
+def test_refresh_resized_file(size, tmpdir, hash_type):
+    path = str(tmpdir.join("blob"))
+    data = os.urandom(1000)
+    write_file(path, data, mtime=1)
+    mt = mutable_merkle.tree.MerkleTree.from_file(path, chunk_size=100, hash_type=hash_type)
+
+    write_file(path, data[:size] + os.urandom(max(0, size - 1000)), mtime=2)
+    mt.refresh(path)
+
+    assert len(mt) == -(-size // 100)
+    assert mt == mutable_merkle.tree.MerkleTree.from_file(path, chunk_size=100, hash_type=hash_type)
+
+
+def test_refresh_requires_from_file(tmpdir, hash_type):
+    path = str(tmpdir.join("blob"))
+    write_file(path, b"abc")
+
+    with pytest.raises(ValueError):
+        mutable_merkle.tree.MerkleTree.new([b"abc"], hash_type=hash_type).refresh(path)
+
+
+GRAFT_VALUES = [str(i).encode() for i in range(40)]
+
+
+@pytest.mark.parametrize("arity,width", ((2, 8), (4, 16)))
+def test_graft_builds_tree_from_subtrees(arity, width, hash_type):
+    mt = mutable_merkle.tree.MerkleTree(hash_type=hash_type, arity=arity)
+
+    for offset in range(0, len(GRAFT_VALUES), width):
+        subtree = mutable_merkle.tree.MerkleTree.new(
+            GRAFT_VALUES[offset:offset + width],
+            hash_type=hash_type,
+            arity=arity,
+        )
+        mt.graft(subtree, offset)
+
+    expected = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES, hash_type=hash_type, arity=arity)
+
+    assert mt.root == expected.root
+    assert mt.branches == expected.branches
+    assert len(mt) == len(GRAFT_VALUES)
+
+
+def test_graft_replaces_interior_block(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES, hash_type=hash_type, indexed=True)
+    subtree = mutable_merkle.tree.MerkleTree.new([b"x", b"y", b"z", b"w"], hash_type=hash_type)
+
+    mt.graft(subtree, 12)
+
+    values = GRAFT_VALUES[:12] + [b"x", b"y", b"z", b"w"] + GRAFT_VALUES[16:]
+    expected = mutable_merkle.tree.MerkleTree.new(values, hash_type=hash_type)
+
+    assert mt.root == expected.root
+    assert mt.branches == expected.branches
+    assert mt.index_of(b"z") == 14
+    assert mt.indices_of(b"13") == []
+
+
+def test_graft_partial_subtree_at_tail(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES[:10], hash_type=hash_type)
+    subtree = mutable_merkle.tree.MerkleTree.new([b"x", b"y", b"z"], hash_type=hash_type)
+
+    mt.graft(subtree, 8)
+
+    expected = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES[:8] + [b"x", b"y", b"z"], hash_type=hash_type)
+
+    assert mt.root == expected.root
+    assert mt.branches == expected.branches
+
+
+def test_graft_invalid(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES[:10], hash_type=hash_type)
+    subtree = mutable_merkle.tree.MerkleTree.new([b"x", b"y", b"z", b"w"], hash_type=hash_type)
+
+    with pytest.raises(ValueError):
+        mt.graft(subtree, 2)
+    with pytest.raises(IndexError):
+        mt.graft(subtree, 12)
+    with pytest.raises(ValueError):
+        mt.graft(mutable_merkle.tree.MerkleTree.new([b"x", b"y", b"z"], hash_type=hash_type), 0)
+    with pytest.raises(ValueError):
+        mt.graft(mutable_merkle.tree.MerkleTree.new([b"x", b"y", b"z", b"w"], hash_type=hash_type, arity=4), 0)
+    with pytest.raises(ValueError):
+        mt.graft(mutable_merkle.tree.MerkleTree(hash_type=hash_type), 0)
+
+
+@pytest.mark.parametrize("arity,offset,size", (
+    (2, 0, 2),
+    (2, 8, 8),
+    (2, 32, 8),
+    (2, 32, 16),
+    (2, 0, 64),
+    (4, 16, 16),
+    (4, 32, 16),
+))
+def test_extract_subtree(arity, offset, size, hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES, hash_type=hash_type, arity=arity)
+
+    subtree = mt.extract_subtree(offset, size)
+    expected = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES[offset:offset + size], hash_type=hash_type, arity=arity)
+
+    assert subtree.root == expected.root
+    assert subtree.branches == expected.branches
+    assert len(subtree) == len(expected)
+
+
+def test_extract_subtree_invalid(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES, hash_type=hash_type)
+
+    with pytest.raises(ValueError):
+        mt.extract_subtree(0, 6)
+    with pytest.raises(ValueError):
+        mt.extract_subtree(0, 1)
+    with pytest.raises(ValueError):
+        mt.extract_subtree(4, 8)
+    with pytest.raises(IndexError):
+        mt.extract_subtree(40, 8)
+
+
+def test_extract_and_graft_round_trip(hash_type):
+    mt = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES, hash_type=hash_type)
+    subtree = mt.extract_subtree(16, 8)
+    subtree.update_leaf(b"z", 3)
+
+    mt.graft(subtree, 16)
+    expected = mutable_merkle.tree.MerkleTree.new(GRAFT_VALUES, hash_type=hash_type)
+    expected.update_leaf(b"z", 19)
+
+    assert mt.root == expected.root